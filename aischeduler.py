@@ -0,0 +1,100 @@
+from array import array
+from time import perf_counter
+from panda3d.core import PStatCollector
+
+
+class AIScheduler:
+    # Level of detail for the ghost AI.  Ghosts close to the player and on
+    # screen are updated every frame.  The others take turns: each frame the
+    # next slice of them (round-robin) is updated, sized so that each one
+    # comes up about every far_interval frames, but shrunk when the AI has
+    # been running over its per-frame time budget.  A ghost that skipped
+    # frames is told how many, so that the steering can catch up.
+    #
+    # A budget of None turns the time limit off, which makes the schedule
+    # independent of how fast the machine is.
+    #
+    # The updated count and AI time of the last frame are kept in updated
+    # and ai_time, and also sent to PStats; total_updated adds up the
+    # updated counts of all frames.
+    def __init__(self, near_distance=25, far_interval=4, budget=.002):
+        self.near_distance = near_distance
+        self.far_interval = far_interval
+        self.budget = budget
+        self.frame = 0
+        self._last = array('l')
+        self._cursor = 0
+        self._cost = 0.0  # seconds per updated ghost, smoothed
+        self._start = 0.0
+        self.updated = 0
+        self.ai_time = 0.0
+        self.total_updated = 0
+        self._time_collector = PStatCollector("App:AI")
+        self._count_collector = PStatCollector("AI ghosts updated")
+
+    def reset(self, npc_id):
+        # Call when a ghost (re)spawns, so it doesn't catch up on frames from
+        # before it existed.
+        last = self._last
+        if npc_id >= len(last):
+            last.extend([0] * (npc_id + 1 - len(last)))
+        last[npc_id] = self.frame - 1
+
+    def schedule(self, registry, npc_ids, player_pos, in_view):
+        # Returns the ids to update this frame and the number of frames each
+        # of them has to catch up on.  in_view(x, y, z) says whether a point
+        # is on screen.
+        self.frame += 1
+        px, py, pz = player_pos[0], player_pos[1], player_pos[2]
+        near_sq = self.near_distance * self.near_distance
+        positions = registry.positions
+
+        near = []
+        far = []
+        for npc_id in npc_ids:
+            i = npc_id * 3
+            x = positions[i]
+            y = positions[i + 1]
+            z = positions[i + 2]
+            if (x - px) ** 2 + (y - py) ** 2 + (z - pz) ** 2 < near_sq and in_view(x, y, z):
+                near.append(npc_id)
+            else:
+                far.append(npc_id)
+
+        if far:
+            count = -(-len(far) // self.far_interval)
+            if self._cost > 0 and self.budget is not None:
+                spare = self.budget - len(near) * self._cost
+                count = min(count, int(spare / self._cost))
+            count = max(1, min(count, len(far)))
+            start = self._cursor % len(far)
+            chosen = far[start:start + count]
+            if len(chosen) < count:
+                chosen += far[:count - len(chosen)]
+            self._cursor = start + count
+            near.extend(chosen)
+            near.sort()
+
+        last = self._last
+        if npc_ids and max(npc_ids) >= len(last):
+            last.extend([self.frame - 1] * (max(npc_ids) + 1 - len(last)))
+        frame = self.frame
+        steps = []
+        for npc_id in near:
+            steps.append(max(1, frame - last[npc_id]))
+            last[npc_id] = frame
+        return near, steps
+
+    def begin(self):
+        self._time_collector.start()
+        self._start = perf_counter()
+
+    def end(self, updated):
+        self.ai_time = perf_counter() - self._start
+        self._time_collector.stop()
+        self.updated = updated
+        self.total_updated += updated
+        self._count_collector.setLevel(updated)
+        if updated:
+            cost = self.ai_time / updated
+            self._cost = cost if self._cost == 0 else self._cost * .9 + cost * .1
@@ -0,0 +1,274 @@
+import argparse
+import gc
+import json
+import subprocess
+import sys
+import tracemalloc
+from time import perf_counter
+
+# Each scenario runs headless (see headless.py) in a process of its own, for
+# the given number of frames, with these HeadlessApp settings.
+SCENARIOS = {
+    "idle": dict(ghosts=0, fire_interval=None),
+    "chase10": dict(ghosts=10, fire_interval=None),
+    "chase50": dict(ghosts=50, fire_interval=None),
+    "chase200": dict(ghosts=200, fire_interval=None),
+    # Fires every tick, with enough mana for every shot to do damage
+    "rapid_fire": dict(ghosts=10, fire_interval=1, mana_regen=1000),
+    # A new wave every 2 seconds, whether or not the last one was cleared
+    "waves": dict(ghosts=10, fire_interval=5, wave_ticks=120, mana_regen=60),
+    # Every spell fired every tick at a wave of 50
+    "shotgun": dict(ghosts=50, fire_interval=1, spell="shotgun", mana_regen=1000),
+    "cone": dict(ghosts=50, fire_interval=1, spell="cone", mana_regen=1000),
+    "nova": dict(ghosts=50, fire_interval=1, spell="nova", mana_regen=1000),
+    # Ghosts following the flow field, which is recomputed whenever the
+    # player enters another cell; always with the numpy backend, the only one
+    # that paths
+    "pathing50": dict(ghosts=50, fire_interval=None, backend="numpy", flowfield_pathing=True),
+}
+
+# Methods timed on every call; the times are inclusive, so Update also
+# contains the ticks run from it, and tick the camera step (movement,
+# gravity and collisions; update is only the mouse look), click and
+# spawnnpcs calls made from it.
+TIMED = ["Update", "tick", "click", "cast", "spawnnpcs", "CameraControllerBehaviour.update", "CameraControllerBehaviour.step",
+         "FlowField._compute", "loadmodels", "createwalls", "loadassets"]
+STARTUP = ["loadmodels", "createwalls", "loadassets"]
+
+# Wall layouts compared by --walls: one node, then split by cell size
+WALL_CELL_SIZES = [None, 8, 16, 32]
+WALL_COLLIDERS = [0, 10, 50]
+
+
+def percentiles(times):
+    # Nearest-rank p50/p95/p99 of a list of seconds, in milliseconds
+    if not times:
+        return {"p50": None, "p95": None, "p99": None}
+    times = sorted(times)
+    last = len(times) - 1
+    return {f"p{p}": round(times[round(last * p / 100)] * 1000, 4) for p in (50, 95, 99)}
+
+
+def instrument(cls, name, times):
+    # Makes every call of cls.name append its duration to times
+    method = getattr(cls, name)
+
+    def timed(*args, **kwargs):
+        start = perf_counter()
+        try:
+            return method(*args, **kwargs)
+        finally:
+            times.append(perf_counter() - start)
+    setattr(cls, name, timed)
+
+
+def run_scenario(name, frames, backend, trace, collide_layers=True, pairs=False):
+    # Runs one scenario in this process and returns its report.  With pairs,
+    # the collision pair tests of every tick are counted between frames.
+    import main
+    from headless import HeadlessApp
+    from layers import count_pair_tests
+
+    timings = {}
+    for timed in TIMED:
+        cls, _, method = timed.rpartition(".")
+        instrument(getattr(main, cls or "MyApp"), method, timings.setdefault(timed, []))
+
+    settings = dict(SCENARIOS[name])
+    backend = settings.pop("backend", backend)
+    HeadlessApp.steering_backend = backend
+    HeadlessApp.flowfield_pathing = settings.pop("flowfield_pathing", HeadlessApp.flowfield_pathing)
+    HeadlessApp.collide_layers = collide_layers
+    HeadlessApp.mana_regen = settings.pop("mana_regen", HeadlessApp.mana_regen)
+    settings.setdefault("wave_ticks", frames + 1)
+    app = HeadlessApp(waves=None, **settings)
+
+    frame_times = []
+    ai_times = []
+    ai_updated = []
+    pair_tests = 0
+    gc.collect()
+    collections = gc.get_stats()[0]["collections"]
+    blocks = sys.getallocatedblocks()
+    if trace:
+        tracemalloc.start()
+    ticks = app.simclock.ticks
+    app.running = True
+    while app.running and len(frame_times) < frames:
+        start = perf_counter()
+        app.taskMgr.step()
+        frame_times.append(perf_counter() - start)
+        app.frames += 1
+        # One tick per frame: the scheduler counters of that tick
+        ai_times.append(app.aischeduler.ai_time)
+        ai_updated.append(app.aischeduler.updated)
+        if pairs:
+            pair_tests += count_pair_tests(app.cTrav, app.render) * (app.simclock.ticks - ticks)
+            ticks = app.simclock.ticks
+    allocations = {
+        "blocks_per_frame": round((sys.getallocatedblocks() - blocks) / len(frame_times), 3),
+        "gc_gen0_collections": gc.get_stats()[0]["collections"] - collections,
+    }
+    if trace:
+        current, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        allocations["traced_kib"] = round(current / 1024, 1)
+        allocations["peak_kib"] = round(peak / 1024, 1)
+
+    report = {
+        "scenario": name,
+        "backend": backend,
+        "frames": len(frame_times),
+        "startup_ms": {task: round(sum(timings[task]) * 1000, 3) for task in STARTUP},
+        "frame_ms": dict(percentiles(frame_times), mean=round(sum(frame_times) / len(frame_times) * 1000, 4)),
+        "tasks": {},
+        "ai": dict(percentiles(ai_times), updated_mean=round(sum(ai_updated) / len(ai_updated), 2), updated_max=max(ai_updated)),
+        "allocations": allocations,
+        "game": app.results(),
+    }
+    if pairs:
+        report["collide_layers"] = collide_layers
+        report["pair_tests_per_frame"] = round(pair_tests / len(frame_times), 1)
+    for task in TIMED:
+        if task not in STARTUP:
+            times = timings[task]
+            report["tasks"][task] = dict(percentiles(times), calls=len(times), total_ms=round(sum(times) * 1000, 3))
+    return report
+
+
+def run_walls(repeats):
+    # Times the collision traversal with the camera at points all over the
+    # ground floor, with the walls in one node and split by each cell size.
+    # Splitting only pays off once there are several moving colliders, so
+    # it is measured with a number of extra ghost-sized spheres as well.
+    from headless import HeadlessApp
+    from collisionpartition import partition_solids
+    from panda3d.core import CollisionNode, CollisionSphere, CollisionHandlerEvent
+
+    app = HeadlessApp(waves=None, ghosts=0, fire_interval=None)
+    points = [(x, y, 7.75) for x in range(-40, 41, 4) for y in range(-60, -3, 4)]
+    handler = CollisionHandlerEvent()
+    spheres = []
+    reports = []
+    for colliders in WALL_COLLIDERS:
+        while len(spheres) < colliders:
+            node = CollisionNode("sphere")
+            node.addSolid(CollisionSphere(0, 0, 0, 1))
+            sphere = app.render.attachNewNode(node)
+            sphere.setPos(*points[len(spheres) * 7 % len(points)])
+            app.cTrav.addCollider(sphere, handler)
+            spheres.append(sphere)
+        for cell_size in WALL_CELL_SIZES:
+            app.wall_collision_node_path.removeNode()
+            app.wall_collision_node_path = partition_solids(app.wall_collision_node, app.render, cell_size)
+            times = []
+            for i in range(repeats):
+                for point in points:
+                    app.camera.setPos(*point)
+                    start = perf_counter()
+                    app.cTrav.traverse(app.render)
+                    times.append(perf_counter() - start)
+            reports.append({
+                "cell_size": cell_size,
+                "nodes": app.wall_collision_node_path.findAllMatches("**/+CollisionNode").getNumPaths() or 1,
+                "extra_colliders": colliders,
+                "traverse_ms": dict(percentiles(times), mean=round(sum(times) / len(times) * 1000, 4)),
+            })
+    return reports
+
+
+def run_layers(names, frames, backend):
+    # Runs each scenario without and with collide mask layers, and reports
+    # the collision pair tests per frame and the frame times of both
+    reports = []
+    for name in names:
+        runs = {}
+        for collide_layers in (False, True):
+            command = [sys.executable, __file__, name, "--single", "--pairs", "--frames", str(frames), "--backend", backend]
+            if not collide_layers:
+                command.append("--no-layers")
+            output = subprocess.run(command, check=True, capture_output=True, text=True).stdout
+            runs[collide_layers] = json.loads(output.splitlines()[-1])
+        before, after = runs[False], runs[True]
+        print(f"{name:12} pair tests/frame {before['pair_tests_per_frame']} -> {after['pair_tests_per_frame']}, "
+              f"p50 {before['frame_ms']['p50']} -> {after['frame_ms']['p50']} ms", file=sys.stderr)
+        reports.append({
+            "scenario": name,
+            "backend": backend,
+            "pair_tests_per_frame": {"before": before["pair_tests_per_frame"], "after": after["pair_tests_per_frame"]},
+            "frame_ms_p50": {"before": before["frame_ms"]["p50"], "after": after["frame_ms"]["p50"]},
+            "health": {"before": before["game"]["health"], "after": after["game"]["health"]},
+        })
+    return reports
+
+
+def compare(baseline, results, tolerance):
+    # Prints the p95 frame time change per scenario; returns the regressions
+    old = {(r["scenario"], r["backend"]): r for r in baseline}
+    regressions = []
+    for report in results:
+        before = old.get((report["scenario"], report["backend"]))
+        if before is None:
+            continue
+        ratio = report["frame_ms"]["p95"] / before["frame_ms"]["p95"]
+        print(f"{report['scenario']:12} {report['backend']:6} p95 {before['frame_ms']['p95']:.3f} -> {report['frame_ms']['p95']:.3f} ms ({ratio:.2f}x)", file=sys.stderr)
+        if ratio > tolerance:
+            regressions.append(report["scenario"])
+    return regressions
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Time scripted headless scenarios.")
+    parser.add_argument("scenarios", nargs="*", default=list(SCENARIOS), help="default: all of them")
+    parser.add_argument("--frames", type=int, default=600)
+    parser.add_argument("--backend", choices=("panda", "numpy"), default="panda")
+    parser.add_argument("--tracemalloc", action="store_true", help="also report traced memory (slower frames)")
+    parser.add_argument("--output", help="write the JSON results here instead of to stdout")
+    parser.add_argument("--compare", help="JSON results of an earlier run to compare against")
+    parser.add_argument("--tolerance", type=float, default=1.25, help="p95 ratio counted as a regression")
+    parser.add_argument("--walls", action="store_true", help="compare wall collision layouts instead")
+    parser.add_argument("--layers", action="store_true", help="compare collision pair tests without and with collide mask layers instead")
+    parser.add_argument("--single", action="store_true", help=argparse.SUPPRESS)
+    parser.add_argument("--pairs", action="store_true", help=argparse.SUPPRESS)
+    parser.add_argument("--no-layers", action="store_true", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.walls:
+        print(json.dumps(run_walls(max(1, args.frames // 100)), indent=2))
+        sys.exit()
+
+    if args.single:
+        # Worker: one scenario, report on the last line of stdout
+        report = run_scenario(args.scenarios[0], args.frames, args.backend, args.tracemalloc, not args.no_layers, args.pairs)
+        print(json.dumps(report))
+        sys.exit()
+
+    for name in args.scenarios:
+        if name not in SCENARIOS:
+            parser.error(f"unknown scenario {name}")
+
+    if args.layers:
+        print(json.dumps(run_layers(args.scenarios, args.frames, args.backend), indent=2))
+        sys.exit()
+
+    results = []
+    for name in args.scenarios:
+        command = [sys.executable, __file__, name, "--single", "--frames", str(args.frames), "--backend", args.backend]
+        if args.tracemalloc:
+            command.append("--tracemalloc")
+        output = subprocess.run(command, check=True, capture_output=True, text=True).stdout
+        results.append(json.loads(output.splitlines()[-1]))
+        print(f"{name}: p50 {results[-1]['frame_ms']['p50']} ms, p99 {results[-1]['frame_ms']['p99']} ms", file=sys.stderr)
+
+    text = json.dumps(results, indent=2)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(text)
+    else:
+        print(text)
+
+    if args.compare:
+        with open(args.compare) as f:
+            regressions = compare(json.load(f), results, args.tolerance)
+        if regressions:
+            sys.exit("Slower: " + ", ".join(regressions))
@@ -2,12 +2,14 @@ from direct.showbase.ShowBase import ShowBase
 from direct.task import Task
 from direct.showbase.DirectObject import DirectObject
 from direct.controls.InputState import InputState
-from panda3d.core import CollisionTraverser, CollisionRay, BitMask32, CollisionHandlerQueue, CollisionHandlerEvent, CollisionNode, CollisionHandlerPusher, CollisionBox, Point3, CollisionSphere, LVector3, CollisionPolygon, WindowProperties
+from panda3d.core import CollisionTraverser, CollisionRay, BitMask32, CollisionHandlerQueue, CollisionHandlerEvent, CollisionNode, CollisionHandlerPusher, CollisionSphere, LVector3, WindowProperties
 from panda3d.ai import AIWorld, AICharacter
 import direct.gui.DirectGuiGlobals as DGG
 from direct.gui.DirectGui import *
 from direct.gui.OnscreenImage import OnscreenImage
 from direct.showbase.Transitions import Transitions
+from spatialgrid import SpatialGrid, separation_offsets
+from level import load_level
 class CameraControllerBehaviour(DirectObject):
     _instances = 0
     def __init__(self, camera, velocity=9, mouse_sensitivity=0.2, initial_pos=(-0.5, -12, 7.7), showbase=None):
@@ -135,6 +137,8 @@ class CameraControllerBehaviour(DirectObject):
         return Task.cont
         
 class MyApp(ShowBase):
+    separation_threshold = 3  # Minimum distance between NPCs
+    repelling_force = .3  # Strength of the repelling force
     
     password = ""
     def tutorial(self, task):
@@ -406,112 +410,23 @@ class MyApp(ShowBase):
         self.healthpoints-=1
         print(self.healthpoints)
     def createwalls(self):
-        self.wall_collision_node = CollisionNode('wall')
-        self.upstairdoor_collision_node = CollisionNode('upstairdoor')
-        self.upstairdoor_collision_node.addSolid(CollisionBox(Point3(14, -9.5, 9), .5, 8, 4))
-        self.upstairdoor_collision_node_path = self.render.attachNewNode(self.upstairdoor_collision_node)
-        self.wall_collision_node.addSolid(CollisionBox(Point3(22, -6.5, 32), 19, .5, 27))
-        self.wall_collision_node.addSolid(CollisionBox(Point3(-23.5, -6.5, 32), 19, .5, 27))
-        self.wall_collision_node.addSolid(CollisionBox(Point3(0, -6.5, 35), 10, .5, 25))
-        self.wall_collision_node.addSolid(CollisionBox(Point3(0, -63, 30), 48, .5, 27))
-        self.wall_collision_node.addSolid(CollisionBox(Point3(41, -35, 32), .5, 28, 27))
-        self.wall_collision_node.addSolid(CollisionBox(Point3(-43, -35, 32), .5, 28, 27))
-        self.wall_collision_node.addSolid(CollisionBox(Point3(0, -35, 2), 43, 28, 4.5))
-        self.wall_collision_node.addSolid(CollisionBox(Point3(0, 0, 0), 15, 7, 2))
-        self.wall_collision_node.addSolid(CollisionBox(Point3(14, -32, 9), .3, 15, 4))
-        self.wall_collision_node.addSolid(CollisionBox(Point3(-17.5, -15, 9), 1.5, .3, 4))
-        self.wall_collision_node.addSolid(CollisionBox(Point3(-25, -15, 9), 1.7, .3, 4))
-        self.wall_collision_node.addSolid(CollisionBox(Point3(-15.75, -12.5, 9), .3, 6, 4))
-        self.wall_collision_node.addSolid(CollisionBox(Point3(-15.75, -34, 9), .3, 11.5, 4))
-        self.wall_collision_node.addSolid(CollisionBox(Point3(-15.75, -57.5, 9), .3, 5, 4))
-        self.wall_collision_node.addSolid(CollisionBox(Point3(14, -56.5, 9), .3, 6, 4))
-        self.wall_collision_node.addSolid(CollisionBox(Point3(13, -35, 9), 10, .3, 4))
-        self.wall_collision_node.addSolid(CollisionBox(Point3(-23, -35, 9), 19, .3, 4))
-        self.wall_collision_node.addSolid(CollisionBox(Point3(-25, -10, 9), .3, 5, 4))
-        self.wall_collision_node.addSolid(CollisionBox(Point3(-33,-41, 9), .3, 5.5, 4))
-        self.wall_collision_node.addSolid(CollisionBox(Point3(-33,-52.5, 9), .3, 2, 4))
-        self.wall_collision_node.addSolid(CollisionBox(Point3(-38,-55, 9), 5, .3, 4))
-        self.wall_collision_node.addSolid(CollisionBox(Point3(23, -20.5, 9), .3, 14.5, 4))
-        self.wall_collision_node.addSolid(CollisionBox(Point3(27, -25, 9), 3.5, .3, 4))
-        self.wall_collision_node.addSolid(CollisionBox(Point3(37.5, -25, 9), 3.5, .3, 4))
-        self.wall_collision_node.addSolid(CollisionBox(Point3(-13, -9, 7), 1, 1, 1))
-        self.wall_collision_node.addSolid(CollisionBox(Point3(8.5, -33, 6), 4.5, 1, .75))
-        self.wall_collision_node.addSolid(CollisionBox(Point3(-10, -33, 6), 4.5, 1, .75))
-        self.wall_collision_node.addSolid(CollisionBox(Point3(-17.5, -30, 6), 1, 4, 4))
-        self.wall_collision_node.addSolid(CollisionBox(Point3(-36, -34.25, 6), 6, 3.25, .75))
-        self.wall_collision_node.addSolid(CollisionBox(Point3(-38.75, -25.5 , 6), 4, 1.25, .75))
-        self.wall_collision_node.addSolid(CollisionBox(Point3(-40, -12 , 6), 2, 4, .75))
-        self.wall_collision_node.addSolid(CollisionBox(Point3(-28, -11 , 6), 1, 1, 1))
-        self.wall_collision_node.addSolid(CollisionBox(Point3(-18, -11 , 6), 1, 1, 1))
-        self.wall_collision_node.addSolid(CollisionBox(Point3(-34.5, -41.4 , 6), 1, 3.6, .75))
-        self.wall_collision_node.addSolid(CollisionBox(Point3(-42, -54 , 6), 1.5, 1.5, 1))
-        self.wall_collision_node.addSolid(CollisionBox(Point3(-25.75, -40, 6), .75, .5, .75))
-        self.wall_collision_node.addSolid(CollisionBox(Point3(-22.5, -40, 6), .75, .5, .75))
-        self.wall_collision_node.addSolid(CollisionBox(Point3(-25.75, -46, 6), .75, .5, .75))
-        self.wall_collision_node.addSolid(CollisionBox(Point3(-22.5, -46, 6), .75, .5, .75))
-        self.wall_collision_node.addSolid(CollisionBox(Point3(-24.25, -42.75, 6), 3.5, 1.5, .75))
-        self.wall_collision_node.addSolid(CollisionBox(Point3(-18, -58, 6), 1, 5, .75))
-        self.wall_collision_node.addSolid(CollisionBox(Point3(-42, -59, 6), 1, 3, .75))
-        self.wall_collision_node.addSolid(CollisionBox(Point3(-11, -37, 6), 5, 1, .75))
-        self.wall_collision_node.addSolid(CollisionBox(Point3(12, -37, 6), 1, 1.5, .75))
-        self.wall_collision_node.addSolid(CollisionBox(Point3(11.25, -61.5, 6), 3.25, 1.5, .75))
-        self.wall_collision_node.addSolid(CollisionBox(Point3(-13.5, -61, 6), 1, 1.5, .75))
-        self.wall_collision_node.addSolid(CollisionBox(Point3(-1, -55, 6), 4.75, 2, .75))
-        self.wall_collision_node.addSolid(CollisionBox(Point3(6, -49, 6), 2, 1.5, .75))
-        self.wall_collision_node.addSolid(CollisionBox(Point3(-7, -49, 6), 2, 1.5, .75))
-        self.wall_collision_node.addSolid(CollisionBox(Point3(-.8, -49.25, 6), 2, 1.5, .75))
-        self.wall_collision_node.addSolid(CollisionBox(Point3(-.75, -43, 6), 4.5, 1.75, .75))
-        self.wall_collision_node.addSolid(CollisionBox(Point3(15.8, -59.5, 6), .8, 2.95, .75))
-        self.wall_collision_node.addSolid(CollisionBox(Point3(23, -58.7, 6), 2.3, 4, .75))
-        self.wall_collision_node.addSolid(CollisionBox(Point3(39, -58.5, 6), 1.6, 4.2, .75))
-        self.wall_collision_node.addSolid(CollisionBox(Point3(39, -40.4, 6), 1.6, 13.155, .75))
-        self.wall_collision_node.addSolid(CollisionBox(Point3(17.75, -36, 6), 2.95, 1.5, .75))
-        self.wall_collision_node.addSolid(CollisionBox(Point3(25, -29.5, 6), 1.3, 2.95, .75))
-        self.wall_collision_node.addSolid(CollisionBox(Point3(24.5, -21, 6), .7, 1, .75))
-        self.wall_collision_node.addSolid(CollisionBox(Point3(26.1, -12.75, 6), 2.8, 1.4, .75))
-        self.wall_collision_node.addSolid(CollisionBox(Point3(24.5, -21, 6), .7, 1, .75))
-        self.wall_collision_node.addSolid(CollisionBox(Point3(39.5, -10, 6), 1, 1, .75))
-        self.wall_collision_node.addSolid(CollisionBox(Point3(39.5, -20.4, 6), 1, 2.5, .75))
-        self.wall_collision_node.addSolid(CollisionPolygon(Point3(14.7, -15, 5), Point3(14.7, -32, 19.2), Point3(22.9, -32, 19.2), Point3(22.9, -15, 5)))
-        self.wall_collision_node.addSolid(CollisionBox(Point3(-16, -35, 14), 31, 28, 4.95))
-        self.wall_collision_node.addSolid(CollisionBox(Point3(28, -47.5, 14), 13.5, 15.5, 4.95))
-        self.wall_collision_node.addSolid(CollisionBox(Point3(32, -18.51, 14), 10, 13.5, 5))
-        self.wall_collision_node.addSolid(CollisionPolygon(Point3(22, -29, 19.2), Point3(22, -33, 19.2), (50, -33, 19.2),Point3(50, -29, 19.2)))
-        self.wall_collision_node.addSolid(CollisionPolygon(Point3(13.7, -32, 19.2), Point3(13.7, -67, 19.2), Point3(22.9, -67, 19.2), Point3(22.9, -32, 19.2)))
-        self.wall_collision_node.addSolid(CollisionBox(Point3(-10.8, -35, 21), 15.2, 5.9, .75))
-        self.wall_collision_node.addSolid(CollisionBox(Point3(6, -35, 21), 2, 4.5, .75))
-        self.wall_collision_node.addSolid(CollisionBox(Point3(-28, -35, 21), 2, 4.5, .75))
-        self.wall_collision_node.addSolid(CollisionPolygon(Point3(14.7, -32, 19.2), Point3(14.7, -36, 26), Point3(19, -36, 26), Point3(19, -32, 19.2)))
-        self.wall_collision_node.addSolid(CollisionPolygon(Point3(10, -36, 34), Point3(10, -40, 34), Point3(17, -40, 26), Point3(14, -36, 26)))
-        self.wall_collision_node.addSolid(CollisionPolygon(Point3(10, -29, 40), Point3(10, -39, 34), Point3(13.5, -36, 29), Point3(13.5, -29, 42)))
-        self.wall_collision_node.addSolid(CollisionPolygon(Point3(12, -27, 39), Point3(12, -32, 37), Point3(19, -34, 46), Point3(19, -28, 46)))
-        self.wall_collision_node.addSolid(CollisionPolygon(Point3(14, -31, 42), Point3(17, -37, 49), Point3(19, -37, 49), Point3(19, -31, 46)))
-        self.wall_collision_node.addSolid(CollisionPolygon(Point3(19, -32, 19.2), Point3(19, -36, 26), Point3(20.5, -36, 26), Point3(20.5, -32, 19.2)))
-        self.wall_collision_node.addSolid(CollisionPolygon(Point3(14, -36, 26), Point3(17, -40, 28), Point3(20.5, -36, 26)))
-        self.wall_collision_node.addSolid(CollisionPolygon(Point3(9, -37, 33), Point3(13, -40, 31), Point3(14, -36, 26)))
-        self.wall_collision_node.addSolid(CollisionPolygon(Point3(12.2, -28, 39), Point3(13.5, -36, 29), Point3(16, -33, 41.5)))
-        self.wall_collision_node.addSolid(CollisionBox(Point3(19, -37.75, 20), 2, 3, 3))
-        self.wall_collision_node.addSolid(CollisionBox(Point3(16, -38.5, 20), 3, 3.5, 3))
-        self.wall_collision_node.addSolid(CollisionPolygon(Point3(20.5, -32, 19.2), Point3(20.5, -36, 26), Point3(20.5, -36, 29.2), Point3(20.5, -32, 26)))
-        self.wall_collision_node.addSolid(CollisionPolygon(Point3(10, -40, 34), Point3(10, -40, 39), Point3(17, -40, 29.2), Point3(17, -40, 26)))
-        self.wall_collision_node.addSolid(CollisionPolygon(Point3(17, -40, 26), Point3(17, -40, 29.2), Point3(20.5, -36, 29.2), Point3(20.5, -36, 26)))
-        self.wall_collision_node.addSolid(CollisionPolygon(Point3(8.75, -37, 32), Point3(8.75, -37, 39), Point3(10, -40, 39), Point3(10, -40, 34)))
-        self.wall_collision_node.addSolid(CollisionPolygon(Point3(10, -29, 40), Point3(10, -29, 46), Point3(8.75, -37, 39), Point3(8.75, -37, 32)))
-        self.wall_collision_node.addSolid(CollisionPolygon(Point3(12, -27, 40), Point3(12, -27, 46), Point3(10, -29, 46), Point3(10, -29, 40)))
-        self.wall_collision_node.addSolid(CollisionPolygon(Point3(19, -28, 46), Point3(19, -28, 52), Point3(12, -27, 46), Point3(12, -27, 40)))
-        self.wall_collision_node.addSolid(CollisionPolygon(Point3(19, -28, 46), Point3(19, -34, 46), Point3(19, -34, 52), Point3(19, -28, 52)))
-        self.wall_collision_node.addSolid(CollisionBox(Point3(14.6, -33.75, 17), .7, .7, 25))
-
-        self.wall_collision_node_path = self.render.attachNewNode(self.wall_collision_node)
+        # The walls and doors are described in levels/mansion.json
+        self.level = load_level(self.loader, "mansion")
+        self.wall_collision_node_path = self.level.find("wall")
+        self.wall_collision_node_path.reparentTo(self.render)
+        self.wall_collision_node = self.wall_collision_node_path.node()
+        self.upstairdoor_collision_node_path = self.level.find("upstairdoor")
+        self.upstairdoor_collision_node_path.reparentTo(self.render)
+        self.upstairdoor_collision_node = self.upstairdoor_collision_node_path.node()
+        self.safe_node_path = self.level.find("safe")
+        self.safe_node_path.reparentTo(self.render)
+        self.safe_node = self.safe_node_path.node()
     def set(self):
         self.Aiworld = AIWorld(self.render)
+        self.npcgrid = SpatialGrid(self.separation_threshold)
         self.i = 0
         self.died = False
         self.waves = 1
-        self.safe_node = CollisionNode('safe')
-        self.safe_node.addSolid(CollisionBox(Point3(-28, -11 , 6), 1, 1, 1))
-        self.safe_node_path = self.render.attachNewNode(self.safe_node)
-        self.safe_node_path.show()
         #AI World updated
         taskMgr.add(self.Update,"Update")
         taskMgr.add(self.tutorial,"tutorial")
@@ -540,20 +455,12 @@ class MyApp(ShowBase):
             if not npc.isEmpty() and not aidot.isEmpty():
                 update_npc_position(npc, aidot)
         # Separation logic to prevent NPC overlap
-            separation_threshold = 3  # Minimum distance between NPCs
-            repelling_force = .3  # Strength of the repelling force
-            npc_positions = {name: npc.getPos(self.render) for name, npc in self.npcs.items() if not npc.isEmpty()}
-            for name_a, pos_a in npc_positions.items():
-                for name_b, pos_b in npc_positions.items():
-                    if name_a != name_b:
-                        distance = (pos_a - pos_b).length()
-                        if distance < separation_threshold:
-                        # Calculate repelling direction
-                            direction = pos_a - pos_b
-                            direction.normalize()
-                        # Apply the repelling force
-                            new_pos = pos_a + direction * repelling_force
-                            self.npcs[name_a].setPos(new_pos)
+        live_npcs = [npc for npc in self.npcs.values() if not npc.isEmpty()]
+        npc_positions = [npc.getPos(self.render) for npc in live_npcs]
+        offsets = separation_offsets(npc_positions, self.separation_threshold, self.repelling_force, self.npcgrid)
+        for npc, pos, offset in zip(live_npcs, npc_positions, offsets):
+            if offset is not None:
+                npc.setPos(pos + LVector3(*offset))
         self.bar['value'] = self.healthpoints
 
         if self.healthpoints < 0 and self.died == False:
@@ -0,0 +1,104 @@
+import json
+
+# Coordinates closer than this are taken to be the same.
+EPSILON = 1e-4
+
+
+def _bounds(box):
+    center = box["center"]
+    half = box["half_extents"]
+    return [center[i] - half[i] for i in range(3)], [center[i] + half[i] for i in range(3)]
+
+
+def _box(lo, hi):
+    return {
+        "center": [round((lo[i] + hi[i]) / 2, 6) for i in range(3)],
+        "half_extents": [round((hi[i] - lo[i]) / 2, 6) for i in range(3)],
+    }
+
+
+def _inside(point, lo, hi):
+    return all(lo[i] - EPSILON <= point[i] <= hi[i] + EPSILON for i in range(3))
+
+
+def _contains(outer, inner):
+    return _inside(inner[0], *outer) and _inside(inner[1], *outer)
+
+
+def _merge(a, b):
+    # The union of two boxes if it is a box itself: equal on two axes and
+    # touching or overlapping on the third.  None otherwise.
+    (alo, ahi), (blo, bhi) = a, b
+    differ = [i for i in range(3) if abs(alo[i] - blo[i]) > EPSILON or abs(ahi[i] - bhi[i]) > EPSILON]
+    if len(differ) > 1:
+        return None
+    if differ:
+        i = differ[0]
+        if alo[i] > bhi[i] + EPSILON or blo[i] > ahi[i] + EPSILON:
+            return None
+    return [min(alo[i], blo[i]) for i in range(3)], [max(ahi[i], bhi[i]) for i in range(3)]
+
+
+def optimize_level(data):
+    # Returns a copy of a level description (see level.py) with fewer wall
+    # solids and the counts of what was done.  Only the walls and ramps are
+    # touched; doors and interactables have to stay separate nodes.
+    report = {"duplicates": 0, "contained": 0, "merged": 0}
+
+    boxes = []
+    for box in data["walls"]:
+        bounds = _bounds(box)
+        if any(_contains(other, bounds) and _contains(bounds, other) for other in boxes):
+            report["duplicates"] += 1
+        else:
+            boxes.append(bounds)
+
+    # Drop boxes inside others and merge neighbours until nothing changes.
+    changed = True
+    while changed:
+        changed = False
+        for i in range(len(boxes)):
+            for j in range(len(boxes)):
+                if i == j:
+                    continue
+                if _contains(boxes[i], boxes[j]):
+                    del boxes[j]
+                    report["contained"] += 1
+                    changed = True
+                    break
+                merged = _merge(boxes[i], boxes[j])
+                if merged is not None:
+                    boxes[i] = merged
+                    del boxes[j]
+                    report["merged"] += 1
+                    changed = True
+                    break
+            if changed:
+                break
+
+    ramps = []
+    for ramp in data["ramps"]:
+        if ramp in ramps:
+            report["duplicates"] += 1
+        elif any(all(_inside(point, *box) for point in ramp) for box in boxes):
+            report["contained"] += 1
+        else:
+            ramps.append(ramp)
+
+    optimized = dict(data, walls=[_box(lo, hi) for lo, hi in boxes], ramps=ramps)
+    report["before"] = len(data["walls"]) + len(data["ramps"])
+    report["after"] = len(optimized["walls"]) + len(optimized["ramps"])
+    return optimized, report
+
+
+def describe(report):
+    return "%(before)d -> %(after)d wall solids (%(duplicates)d duplicates, %(contained)d contained, %(merged)d merged)" % report
+
+
+if __name__ == "__main__":
+    # python collisionoptimizer.py levels/mansion.json ... reports what
+    # compiling the given levels would save
+    import sys
+    for path in sys.argv[1:]:
+        with open(path) as f:
+            print(path + ":", describe(optimize_level(json.load(f))[1]))
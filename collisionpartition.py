@@ -0,0 +1,39 @@
+from math import floor
+from panda3d.core import CollisionNode, BoundingVolume
+
+
+def partition_solids(node, parent, cell_size=32):
+    # Copies the solids of one big CollisionNode into several smaller ones
+    # under a new node, so that the traverser can skip most of them by their
+    # bounds.  Solids are grouped by the grid cell their centre is in; a
+    # solid too big for a cell (floors, outer walls) gets a node of its own,
+    # so that it doesn't blow up the bounds of the small ones around it.
+    # Every node keeps the original name and collide masks, and has box
+    # bounds, which fit walls much better than spheres do.
+    #
+    # With no cell_size, the node is attached as it is.
+    if not cell_size:
+        return parent.attachNewNode(node)
+
+    root = parent.attachNewNode(node.getName() + "-cells")
+    cells = {}
+    large = []
+    for solid in node.getSolids():
+        bounds = solid.getBounds()
+        lo = bounds.getMin()
+        hi = bounds.getMax()
+        if max(hi - lo) > cell_size:
+            large.append([solid])
+            continue
+        key = tuple(floor((lo[i] + hi[i]) / 2 / cell_size) for i in range(3))
+        cells.setdefault(key, []).append(solid)
+
+    for solids in list(cells.values()) + large:
+        cell = CollisionNode(node.getName())
+        cell.setFromCollideMask(node.getFromCollideMask())
+        cell.setIntoCollideMask(node.getIntoCollideMask())
+        cell.setBoundsType(BoundingVolume.BT_box)
+        for solid in solids:
+            cell.addSolid(solid)
+        root.attachNewNode(cell)
+    return root
@@ -0,0 +1,220 @@
+from array import array
+from collections import deque
+from math import ceil, floor, sqrt
+from panda3d.core import CollisionBox
+
+try:
+    # Optional, as in npcqueries.py; FlowField falls back to _compute_loops
+    import numpy as np
+except ImportError:
+    np = None
+
+
+# Neighbour offsets; the first four are the orthogonal ones.
+NEIGHBOURS = ((1, 0), (-1, 0), (0, 1), (0, -1), (1, 1), (1, -1), (-1, 1), (-1, -1))
+
+
+class FlowField:
+    # Occupancy grid of the floor plan at one height, plus a flow field that
+    # points every free cell toward the goal (the player).  The field is only
+    # recomputed when the goal moves to another cell, so any number of ghosts
+    # can follow it for the cost of one breadth-first search per player move.
+    def __init__(self, boxes, height, cell_size=1.0, margin=1.0):
+        # boxes are (min, max) corner pairs; only those that cross the given
+        # height block anything.  margin keeps the ghosts off the walls.
+        boxes = [(lo, hi) for lo, hi in boxes if lo[2] <= height <= hi[2]]
+        self.cell_size = cell_size
+        self.height = height
+        if boxes:
+            self.x0 = min(lo[0] for lo, hi in boxes)
+            self.y0 = min(lo[1] for lo, hi in boxes)
+            x1 = max(hi[0] for lo, hi in boxes)
+            y1 = max(hi[1] for lo, hi in boxes)
+        else:
+            self.x0 = self.y0 = x1 = y1 = 0
+        self.width = int((x1 - self.x0) / cell_size) + 1
+        self.depth = int((y1 - self.y0) / cell_size) + 1
+
+        self.blocked = bytearray(self.width * self.depth)
+        for lo, hi in boxes:
+            self._rasterize(lo[0] - margin, lo[1] - margin, hi[0] + margin, hi[1] + margin)
+        self._init_field()
+
+    @classmethod
+    def from_collision_node(cls, node, height, cell_size=1.0, margin=1.0):
+        boxes = []
+        for solid in node.getSolids():
+            if isinstance(solid, CollisionBox):
+                boxes.append((solid.getMin(), solid.getMax()))
+        return cls(boxes, height, cell_size, margin)
+
+    @classmethod
+    def from_navfloor(cls, floor):
+        # Uses the grid of a navgrid.NavFloor as it is, without copying it
+        field = cls.__new__(cls)
+        field.cell_size = floor.cell_size
+        field.height = floor.height
+        field.x0 = floor.x0
+        field.y0 = floor.y0
+        field.width = floor.width
+        field.depth = floor.depth
+        field.blocked = floor.blocked
+        field._init_field()
+        return field
+
+    def _init_field(self):
+        # Steps to the goal per cell (-1 if unreachable) and a unit
+        # direction (x, y) per cell, (0, 0) for the goal and unreachable cells.
+        self._unreached = array('i', [-1]) * (self.width * self.depth)
+        self._still = array('f', bytes(8 * self.width * self.depth))
+        self.distance = array('i', self._unreached)
+        self.flow = array('f', self._still)
+        self.goal = -1
+
+    def _rasterize(self, x0, y0, x1, y1):
+        # Blocks every cell whose centre lies inside the rectangle.
+        cs = self.cell_size
+        i0 = max(0, ceil((x0 - self.x0) / cs - .5))
+        j0 = max(0, ceil((y0 - self.y0) / cs - .5))
+        i1 = min(self.width - 1, floor((x1 - self.x0) / cs - .5))
+        j1 = min(self.depth - 1, floor((y1 - self.y0) / cs - .5))
+        for j in range(j0, j1 + 1):
+            row = j * self.width
+            for i in range(i0, i1 + 1):
+                self.blocked[row + i] = 1
+
+    def cell(self, x, y):
+        i = floor((x - self.x0) / self.cell_size)
+        j = floor((y - self.y0) / self.cell_size)
+        if 0 <= i < self.width and 0 <= j < self.depth:
+            return j * self.width + i
+        return -1
+
+    def update(self, x, y):
+        # Call with the player position every frame; returns True if the
+        # field had to be recomputed.
+        goal = self.cell(x, y)
+        if goal == self.goal:
+            return False
+        self.goal = goal
+        self._compute(goal)
+        return True
+
+    def _compute(self, goal):
+        self.distance[:] = self._unreached
+        self.flow[:] = self._still
+        if goal < 0:
+            return
+        if np is not None:
+            self._compute_numpy(goal)
+        else:
+            self._compute_loops(goal)
+
+    def _compute_numpy(self, goal):
+        # The same search and flow as _compute_loops, a whole wavefront or
+        # grid at a time.  Works on a copy of the grid with a border of
+        # blocked cells, so that neighbours never need a bounds check.
+        width = self.width
+        depth = self.depth
+        stride = width + 2
+        free = np.zeros((depth + 2, stride), dtype=bool)
+        free[1:-1, 1:-1] = np.frombuffer(self.blocked, dtype=np.uint8).reshape(depth, width) == 0
+        free = free.ravel()
+        distance = np.full(free.shape, -1, dtype=np.int32)
+        start = (goal // width + 1) * stride + goal % width + 1
+        distance[start] = 0
+        free[start] = False
+
+        # Breadth-first, in wavefronts: free is cleared as cells are reached
+        frontier = np.array([start])
+        offsets = np.array([1, -1, stride, -stride])
+        slot = np.empty(free.shape, dtype=np.intp)
+        step = 0
+        while len(frontier):
+            step += 1
+            cells = (frontier[:, None] + offsets).ravel()
+            cells = cells[free[cells]]
+            # Without the cells reached from two sides twice
+            order = np.arange(len(cells))
+            slot[cells] = order
+            cells = cells[slot[cells] == order]
+            distance[cells] = step
+            free[cells] = False
+            frontier = cells
+
+        # Per cell, the first neighbour in NEIGHBOURS order that is nearer
+        # to the goal than all the ones before it
+        grid = distance.reshape(depth + 2, stride)
+        inner = grid[1:-1, 1:-1]
+
+        def shifted(di, dj):
+            return grid[1 + dj:depth + 1 + dj, 1 + di:width + 1 + di]
+        best = inner.copy()
+        choice = np.full(inner.shape, -1, dtype=np.int8)
+        for k, (di, dj) in enumerate(NEIGHBOURS):
+            other = shifted(di, dj)
+            better = (other >= 0) & (other < best)
+            if di and dj:
+                # Don't cut corners past a blocked cell.
+                better &= (shifted(di, 0) >= 0) & (shifted(0, dj) >= 0)
+            best = np.where(better, other, best)
+            choice[better] = k
+
+        diagonal = 1 / sqrt(2)
+        steps = np.array([(di * diagonal, dj * diagonal) if di and dj else (di, dj) for di, dj in NEIGHBOURS],
+                         dtype=np.float32)
+        flow = np.frombuffer(self.flow, dtype=np.float32).reshape(depth, width, 2)
+        guided = (inner > 0) & (choice >= 0)
+        flow[guided] = steps[choice[guided]]
+        np.frombuffer(self.distance, dtype=np.int32).reshape(depth, width)[:] = inner
+        del flow
+
+    def _compute_loops(self, goal):
+        width = self.width
+        depth = self.depth
+        blocked = self.blocked
+        distance = self.distance
+        flow = self.flow
+
+        distance[goal] = 0
+        queue = deque((goal,))
+        while queue:
+            index = queue.popleft()
+            i = index % width
+            j = index // width
+            step = distance[index] + 1
+            for di, dj in NEIGHBOURS[:4]:
+                ni = i + di
+                nj = j + dj
+                if 0 <= ni < width and 0 <= nj < depth:
+                    other = nj * width + ni
+                    if distance[other] < 0 and not blocked[other]:
+                        distance[other] = step
+                        queue.append(other)
+
+        diagonal = 1 / sqrt(2)
+        for index, dist in enumerate(distance):
+            if dist <= 0:
+                continue
+            i = index % width
+            j = index // width
+            best = dist
+            best_step = None
+            for di, dj in NEIGHBOURS:
+                ni = i + di
+                nj = j + dj
+                if not (0 <= ni < width and 0 <= nj < depth):
+                    continue
+                other_dist = distance[nj * width + ni]
+                if other_dist < 0 or other_dist >= best:
+                    continue
+                if di and dj and (distance[j * width + ni] < 0 or distance[nj * width + i] < 0):
+                    # Don't cut corners past a blocked cell.
+                    continue
+                best = other_dist
+                best_step = (di, dj)
+            if best_step is not None:
+                di, dj = best_step
+                scale = diagonal if di and dj else 1.0
+                flow[index * 2] = di * scale
+                flow[index * 2 + 1] = dj * scale
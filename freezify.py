@@ -58,6 +58,15 @@ CONVERT_MODELS_EMBED_TEXTURES = True
 for model in CONVERT_MODELS:
     PRELOAD_FILES.append(model + ".bam")
 
+# Level descriptions to compile to .bam collision graphs (see level.py)
+CONVERT_LEVELS = [
+    "levels/mansion.json",
+]
+
+for level in CONVERT_LEVELS:
+    PRELOAD_FILES.append(level[:-5] + ".bam")
+    PRELOAD_FILES.append(level[:-5] + ".nav")
+
 
 class EmscriptenEnvironment:
     platform = 'emscripten'
@@ -240,53 +249,48 @@ Py_FrozenMain(int argc, char **argv)
 }
 """
 
-def _model_to_bam(srcpath, dstpath, embed_textures=False):
-    import panda3d.core as p3d
+def _model_to_bam(srcpath, dstpath, embed_textures=False, prepare=None):
     if dstpath.endswith('.gz') or dstpath.endswith('.pz'):
         dstpath = dstpath[:-3]
     dstpath = dstpath + '.bam'
 
-    src_fn = p3d.Filename.from_os_specific(srcpath)
-    dst_fn = p3d.Filename.from_os_specific(dstpath)
-    dst_fn.set_binary()
-
-    loader = p3d.Loader.get_global_ptr()
-    options = p3d.LoaderOptions(p3d.LoaderOptions.LF_report_errors |
-                                p3d.LoaderOptions.LF_no_ram_cache)
-    node = loader.load_sync(src_fn, options)
-    if not node:
-        raise IOError('Failed to load model: %s' % (srcpath))
-
-    stream = p3d.OFileStream()
-    if not dst_fn.open_write(stream):
-        raise IOError('Failed to open .bam file for writing: %s' % (dstpath))
-
-    # We pass it the source filename here so that texture files are made
-    # relative to the original pathname and don't point from the destination
-    # back into the source directory.
-    dout = p3d.DatagramOutputFile()
-    if not dout.open(stream, src_fn) or not dout.write_header("pbj\0\n\r"):
-        raise IOError('Failed to write to .bam file: %s' % (dstpath))
-
-    writer = p3d.BamWriter(dout)
-    writer.root_node = node
-    writer.init()
+    model = load_file(srcpath)
+    if prepare is not None:
+        before = scene_stats(model)
+        model = prepare(model)
+        print(srcpath + ":", describe(before, scene_stats(model)),
+              "- triangles", " -> ".join(str(count) for count in triangle_counts(model)))
+
+    # Texture files that are not embedded are made relative to the source
+    # model, so that they don't point from the destination back into the
+    # source directory.
     if embed_textures:
-        writer.set_file_texture_mode(p3d.BamEnums.BTM_rawdata)
+        write_bam(model, dstpath)
     else:
-        writer.set_file_texture_mode(p3d.BamEnums.BTM_relative)
-    writer.write_object(node)
-    writer.flush()
-    writer = None
-    dout.close()
-    dout = None
-    stream.close()
+        write_bam(model, dstpath, srcpath, BamEnums.BTM_relative)
+
+# Static models are flattened on the way (see sceneprep.py), and the ghost
+# and monster get their levels of detail (see lod.py)
+from sceneprep import STATIC_MODELS, scene_stats, describe
+from lod import LOD_MODELS, triangle_counts
+from modelcache import load_file, write_bam
+from panda3d.core import BamEnums
 
 for model in CONVERT_MODELS:
-    _model_to_bam(model, model, CONVERT_MODELS_EMBED_TEXTURES)
+    _model_to_bam(model, model, CONVERT_MODELS_EMBED_TEXTURES, STATIC_MODELS.get(model) or LOD_MODELS.get(model))
+
+from level import compile_level
+from navgrid import compile_navgrid
+
+for level in CONVERT_LEVELS:
+    compile_level(level, level[:-5] + ".bam")
+    compile_navgrid(level, level[:-5] + ".nav")
+
 
+# The game's own helper modules live next to main.py
+GAME_DIR = os.path.dirname(os.path.abspath(__file__))
 
-freezer.moduleSearchPath = [PANDA_BUILT_DIR, PY_STDLIB_DIR, PY_MODULE_DIR]
+freezer.moduleSearchPath = [GAME_DIR, PANDA_BUILT_DIR, PY_STDLIB_DIR, PY_MODULE_DIR]
 
 # Set this to keep the intermediate .c and .o file
 #freezer.keepTemporaryFiles = True
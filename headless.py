@@ -0,0 +1,155 @@
+import argparse
+import json
+from math import atan2, degrees, hypot
+from panda3d.core import loadPrcFileData, ClockObject
+
+loadPrcFileData("", "audio-library-name null")
+
+from main import MyApp
+
+
+class HeadlessApp(MyApp):
+    # Runs the game without a window or a player, as fast as it can: a bot
+    # walks the camera through the mansion along the waypoints (by default
+    # the level's spawn points), waves of ghosts are spawned at the spawn
+    # points one after the other, and the wand is fired at the nearest ghost
+    # at a fixed interval (casting spell, see MyApp.spell).
+    #
+    # The models are loaded before the first frame, the clock is switched to
+    # a fixed frame rate (one tick per frame) and the AI time budget is off,
+    # so that a run with the same arguments always gives the same result.
+    # The player can't die; deaths are counted and the health is reset
+    # instead.
+    #
+    # waves=None keeps sending waves and fire_interval=None never fires;
+    # run() then needs a number of frames to stop after.
+    headless = True
+    async_loading = False
+    ai_budget = None
+
+    def __init__(self, waves=3, ghosts=10, path=None, fire_interval=20, wave_ticks=3600, frame_rate=60, spell="wand"):
+        self.tick_rate = frame_rate
+        super().__init__()
+        clock = ClockObject.getGlobalClock()
+        clock.setMode(ClockObject.MNonRealTime)
+        clock.setFrameRate(frame_rate)
+        self.triggers.destroy()
+        self.spell = spell
+
+        self.waves = waves
+        self.ghosts = ghosts
+        # Where the door triggers bring in ghosts, as read from the level
+        self.doors = [(x, y) for trigger, x, y, ghosts, cooldown in self.spawns]
+        self.path = path or self.doors
+        self.fire_interval = fire_interval
+        self.wave_ticks = wave_ticks
+        self.waypoint = 0
+        self.waypoint_ticks = 0
+        self.wave = 0
+        self.wave_start = 0
+        self.spawned = 0
+        self.survived = 0
+        self.shots = 0
+        self.deaths = 0
+        self.frames = 0
+
+    def death(self):
+        self.deaths += 1
+        self.healthpoints = 100
+        self.died = False
+
+    def play(self):
+        # Called at the start of every tick
+        ticks = self.simclock.ticks
+        if not self.npcs.alive_ids() or ticks - self.wave_start >= self.wave_ticks:
+            for npc_id in self.npcs.alive_ids():
+                self.survived += 1
+                self.despawnnpc(npc_id)
+            if self.wave == self.waves:
+                return False
+            x, y = self.doors[self.wave % len(self.doors)]
+            if self.ghosts:
+                self.spawnnpcs(self.ghosts, x, y)
+            self.spawned += self.ghosts
+            self.wave += 1
+            self.wave_start = ticks
+
+        if self.fire_interval and ticks % self.fire_interval == 0:
+            self.fire()
+        else:
+            self.walk()
+        return True
+
+    def walk(self):
+        # Head for the next waypoint; skip it if a wall keeps us from it
+        x, y = self.path[self.waypoint]
+        pos = self.camera.getPos(self.render)
+        self.waypoint_ticks += 1
+        if hypot(x - pos.x, y - pos.y) < 1.5 or self.waypoint_ticks > 10 * self.tick_rate:
+            self.waypoint = (self.waypoint + 1) % len(self.path)
+            self.waypoint_ticks = 0
+            x, y = self.path[self.waypoint]
+        self.cam_controller.look(degrees(atan2(pos.x - x, y - pos.y)), 0)
+        self.cam_controller.press('forward')
+
+    def fire(self):
+        # Aim at the nearest ghost and click
+        self.cam_controller.press('forward', False)
+        pos = self.camera.getPos(self.render)
+        nearest = None
+        for npc_id in self.npcs.alive_ids():
+            x, y, z = self.npcs.get_pos(npc_id)
+            distance = (x - pos.x) ** 2 + (y - pos.y) ** 2 + (z - pos.z) ** 2
+            if nearest is None or distance < nearest[0]:
+                nearest = (distance, npc_id)
+        if nearest is None:
+            return
+        self.camera.lookAt(self.npcs.nodes[nearest[1]])
+        self.cam_controller.look(self.camera.getH(), self.camera.getP())
+        self.click()
+        self.shots += 1
+
+    def tick(self, dt):
+        self.running = self.play()
+        if self.running:
+            super().tick(dt)
+
+    def run(self, frames=None):
+        self.running = True
+        while self.running and self.frames != frames:
+            self.taskMgr.step()
+            self.frames += 1
+        return self.results()
+
+    def results(self):
+        pos = self.camera.getPos(self.render)
+        stats = self.npcstats()
+        return {
+            "waves": self.wave,
+            "frames": self.frames,
+            "ticks": self.simclock.ticks,
+            "spawned": self.spawned,
+            "killed": self.spawned - self.survived - len(self.npcs),
+            "shots": self.shots,
+            "deaths": self.deaths,
+            "health": round(self.healthpoints, 3),
+            "mana": round(self.manaamount, 3),
+            "camera": [round(pos.x, 3), round(pos.y, 3), round(pos.z, 3)],
+            "npcs": stats,
+            # Ghosts given AI per tick, of the active ones (see AIScheduler)
+            "ai_updated_per_tick": round(self.aischeduler.total_updated / max(self.aischeduler.frame, 1), 3),
+        }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Play waves of ghosts without a window.")
+    parser.add_argument("--waves", type=int, default=3)
+    parser.add_argument("--ghosts", type=int, default=10, help="ghosts per wave")
+    parser.add_argument("--fire-interval", type=int, default=20, help="ticks between wand shots")
+    parser.add_argument("--wave-ticks", type=int, default=3600, help="ticks before a wave is cut short")
+    parser.add_argument("--spell", choices=("wand", "shotgun", "cone", "nova"), default="wand")
+    parser.add_argument("--backend", choices=("panda", "numpy"), default=MyApp.steering_backend)
+    args = parser.parse_args()
+    HeadlessApp.steering_backend = args.backend
+    app = HeadlessApp(args.waves, args.ghosts, fire_interval=args.fire_interval, wave_ticks=args.wave_ticks, spell=args.spell)
+    print(json.dumps(app.run(), indent=2))
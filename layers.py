@@ -0,0 +1,38 @@
+from panda3d.core import BitMask32
+
+# Collide mask bits.  Every collision node is put in one or more layers
+# (its into mask), and every collider only tests the layers it cares about
+# (its from mask).  None of these are in GeomNode.getDefaultCollideMask(),
+# so visible geometry is never tested.
+PICKRAY = BitMask32.bit(0)  # the wand ray; nothing collides into it
+WORLD = BitMask32.bit(1)  # walls, floors, ramps and closed doors
+GHOST = BitMask32.bit(2)
+PLAYER = BitMask32.bit(3)  # the camera
+INTERACTABLE = BitMask32.bit(4)  # things the wand can use: the safe, doors
+# Trigger volumes (see triggers.py), only tested by the trigger probe.  Out of
+# CollisionNode.getDefaultCollideMask() as well, so that colliders that keep
+# the default masks (schoolbuilding.py) don't hit them either.
+TRIGGER = BitMask32.bit(21)
+
+# What each collider tests against
+# Only pushed out of the walls: crowding ghosts could shove the camera down
+# through the floor, and ghosts hurt by being near (see proximitydamage.py)
+PLAYER_COLLIDES = WORLD
+PICKRAY_COLLIDES = WORLD | GHOST | INTERACTABLE
+
+
+def count_pair_tests(traverser, root):
+    # The number of (from solid, into solid) pairs that pass the collide
+    # mask test in a traversal of root: an upper bound on the solid tests,
+    # before the bounding volumes cull any of them.
+    intos = []
+    for path in root.findAllMatches("**/+CollisionNode"):
+        node = path.node()
+        intos.append((node, node.getIntoCollideMask(), node.getNumSolids()))
+    pairs = 0
+    for i in range(traverser.getNumColliders()):
+        collider = traverser.getCollider(i).node()
+        mask = collider.getFromCollideMask()
+        solids = sum(count for node, into, count in intos if node != collider and not (into & mask).isZero())
+        pairs += collider.getNumSolids() * solids
+    return pairs
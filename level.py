@@ -0,0 +1,98 @@
+import json
+import os
+from panda3d.core import NodePath, CollisionNode, CollisionBox, CollisionPolygon, Point3, Filename, VirtualFileSystem, getModelPath
+from collisionoptimizer import optimize_level, describe
+
+
+def build_level(data):
+    # Turns a level description (see levels/mansion.json) into a scene graph:
+    #   level/wall          one CollisionNode with every wall box and ramp
+    #   level/<door>        a CollisionNode per door, and per interactable
+    #   level/spawns/spawn<i>  a CollisionNode with the trigger box of each
+    #                          spawn, tagged with where the ghosts appear,
+    #                          how many and the cooldown ("" for once)
+    root = NodePath("level")
+
+    walls = CollisionNode("wall")
+    for box in data["walls"]:
+        walls.addSolid(CollisionBox(Point3(*box["center"]), *box["half_extents"]))
+    for ramp in data["ramps"]:
+        walls.addSolid(CollisionPolygon(*[Point3(*point) for point in ramp]))
+    root.attachNewNode(walls)
+
+    for box in data["doors"] + data["interactables"]:
+        node = CollisionNode(box["name"])
+        node.addSolid(CollisionBox(Point3(*box["center"]), *box["half_extents"]))
+        path = root.attachNewNode(node)
+        if box.get("show"):
+            path.show()
+
+    spawns = root.attachNewNode("spawns")
+    for i, spawn in enumerate(data["spawns"]):
+        trigger = CollisionNode("spawn%d" % i)
+        box = spawn["trigger"]
+        trigger.addSolid(CollisionBox(Point3(*box["center"]), *box["half_extents"]))
+        path = spawns.attachNewNode(trigger)
+        path.setTag("at", "%s %s" % tuple(spawn["at"]))
+        path.setTag("ghosts", str(spawn["ghosts"]))
+        path.setTag("cooldown", "" if spawn.get("cooldown") is None else str(spawn["cooldown"]))
+    return root
+
+
+def compile_level(srcpath, dstpath):
+    # Writes the scene graph of a level description to a .bam file, with
+    # the wall solids optimized
+    with open(srcpath) as f:
+        data, report = optimize_level(json.load(f))
+    print(srcpath + ":", describe(report))
+    root = build_level(data)
+    if not root.writeBamFile(dstpath):
+        raise IOError('Failed to write .bam file: %s' % (dstpath))
+
+
+def find_file(path):
+    # The OS path of a game file such as "levels/mansion.json", looked up on
+    # the model path like the loader does for models, so that the game can
+    # be started from any directory; None if there is no such file
+    filename = Filename(path)
+    if not VirtualFileSystem.getGlobalPtr().resolveFilename(filename, getModelPath().getValue()):
+        return None
+    return filename.toOsSpecific()
+
+
+def is_stale(srcpath, dstpath):
+    # Whether a file made from srcpath (either may be None) needs making again
+    return dstpath is None or (srcpath is not None and os.path.getmtime(srcpath) > os.path.getmtime(dstpath))
+
+
+def load_level(loader, name):
+    # Loads levels/<name>.bam as compiled by freezify.py, or builds the level
+    # from levels/<name>.json when there is no .bam or the .json is newer
+    # (optimized the same way, so that both give the same walls).
+    # The level is not cached: doors are changed when they open.
+    srcpath = find_file("levels/%s.json" % name)
+    bampath = find_file("levels/%s.bam" % name)
+    if not is_stale(srcpath, bampath):
+        return loader.loadModel(Filename.fromOsSpecific(bampath), noCache=True)
+    if srcpath is None:
+        raise IOError("No level %s" % name)
+    with open(srcpath) as f:
+        return build_level(optimize_level(json.load(f))[0])
+
+
+def spawn_triggers(level):
+    # [(trigger NodePath, spawn x, spawn y, ghosts, cooldown)] of a loaded
+    # level; cooldown is None for a spawn that only happens once
+    triggers = []
+    for spawn in level.find("spawns").getChildren():
+        x, y = spawn.getTag("at").split()
+        cooldown = spawn.getTag("cooldown")
+        triggers.append((spawn, float(x), float(y), int(spawn.getTag("ghosts")), float(cooldown) if cooldown else None))
+    return triggers
+
+
+if __name__ == "__main__":
+    # python level.py levels/mansion.json ... compiles the given levels
+    import sys
+    for srcpath in sys.argv[1:]:
+        compile_level(srcpath, srcpath[:-5] + ".bam")
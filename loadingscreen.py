@@ -0,0 +1,25 @@
+from direct.gui.DirectGui import DirectFrame, DirectLabel, DirectWaitBar
+import direct.gui.DirectGuiGlobals as DGG
+
+
+class LoadingScreen:
+    # Covers the screen with a progress bar until total assets are loaded;
+    # call advance() as each one comes in.
+    def __init__(self, total):
+        self.total = total
+        self.loaded = 0
+        self.frame = DirectFrame(frameColor=(0, 0, 0, 1), frameSize=(-3, 3, -1, 1), sortOrder=1000)
+        self.label = DirectLabel(parent=self.frame, text="Loading", text_fg=(1, 1, 1, 1),
+                                 frameColor=(0, 0, 0, 0), scale=.07, pos=(0, 0, .1))
+        self.bar = DirectWaitBar(parent=self.frame, range=max(total, 1), value=0, pos=(0, 0, -.1))
+        self.bar['barColor'] = (0, 9, 2, 2)
+        self.bar['frameSize'] = (-.5, .5, -.035, .02)
+        self.bar['barRelief'] = DGG.SUNKEN
+
+    def advance(self, name):
+        self.loaded += 1
+        self.bar['value'] = self.loaded
+        self.label['text'] = "Loaded %s (%d/%d)" % (name, self.loaded, self.total)
+
+    def destroy(self):
+        self.frame.destroy()
@@ -0,0 +1,171 @@
+from math import floor
+from panda3d.core import (NodePath, LODNode, Geom, GeomPrimitive, GeomTriangles, GeomVertexData,
+                          GeomVertexReader, GeomVertexWriter, Thread)
+
+# Levels of detail are made by vertex clustering: the model is cut into a
+# grid of cubes, the vertices in each cube are merged into one at their
+# average position (keeping the other columns, such as the normal and uv, of
+# the first) and the triangles that collapse are dropped.  Crude next to
+# edge collapse, but quick, and good enough for what is seen from afar.
+#
+# Per model: [(cube size as a fraction of the model's diagonal, distance
+# from which that level is shown)], from the most detailed reduced level on.
+# Distances are in the model's own units; the ghosts are drawn at scale 2
+# and the monster at scale 15 (schoolbuilding.py).
+GHOST_LODS = [(.04, 10), (.1, 25)]
+MONSTER_LODS = [(.03, 2), (.08, 5)]
+
+# Where the last level stops being drawn
+FAR = 1e6
+
+
+def _decimate_geom(geom, cell):
+    # A copy of geom with its vertices clustered in cubes of size cell, or
+    # None if no triangle is left
+    geom = geom.decompose()
+    vdata = geom.getVertexData()
+    reader = GeomVertexReader(vdata, "vertex")
+    clusters = {}
+    sources = []  # the first vertex of every cluster
+    sums = []
+    remap = []  # new row of every old row
+    while not reader.isAtEnd():
+        x, y, z = reader.getData3()
+        key = (floor(x / cell), floor(y / cell), floor(z / cell))
+        row = clusters.get(key)
+        if row is None:
+            row = clusters[key] = len(sources)
+            sources.append(len(remap))
+            sums.append([0.0, 0.0, 0.0, 0])
+        total = sums[row]
+        total[0] += x
+        total[1] += y
+        total[2] += z
+        total[3] += 1
+        remap.append(row)
+
+    triangles = GeomTriangles(Geom.UHStatic)
+    seen = set()
+    for i in range(geom.getNumPrimitives()):
+        primitive = geom.getPrimitive(i)
+        if primitive.getPrimitiveType() != GeomPrimitive.PT_polygons:
+            continue
+        for j in range(primitive.getNumPrimitives()):
+            start = primitive.getPrimitiveStart(j)
+            a, b, c = (remap[primitive.getVertex(start + k)] for k in range(3))
+            key = tuple(sorted((a, b, c)))
+            if a == b or b == c or a == c or key in seen:
+                continue
+            seen.add(key)
+            triangles.addVertices(a, b, c)
+    if not seen:
+        return None
+
+    reduced = GeomVertexData(vdata.getName(), vdata.getFormat(), Geom.UHStatic)
+    reduced.setNumRows(len(sources))
+    thread = Thread.getCurrentThread()
+    for row, source in enumerate(sources):
+        reduced.copyRowFrom(row, vdata, source, thread)
+    writer = GeomVertexWriter(reduced, "vertex")
+    for x, y, z, count in sums:
+        writer.setData3(x / count, y / count, z / count)
+    result = Geom(reduced)
+    result.addPrimitive(triangles)
+    return result
+
+
+def decimate(model, cell):
+    # A copy of model with every Geom clustered in cubes of size cell, in
+    # the space of each GeomNode (flatten the model first)
+    copy = NodePath(model.node().copySubgraph())
+    for path in copy.findAllMatches("**/+GeomNode"):
+        node = path.node()
+        for i in reversed(range(node.getNumGeoms())):
+            geom = _decimate_geom(node.getGeom(i), cell)
+            if geom is None:
+                node.removeGeom(i)
+            else:
+                node.setGeom(i, geom)
+    return copy
+
+
+def make_lod(model, levels):
+    # Returns model flattened under an LODNode, with a reduced copy per
+    # level (see GHOST_LODS).  Models that already have one are returned
+    # as they are.
+    if not model.find("**/+LODNode").isEmpty():
+        return model
+    model.clearModelNodes()
+    model.flattenStrong()
+    lo, hi = model.getTightBounds()
+    size = (hi - lo).length()
+
+    root = NodePath(model.getName())
+    lod = root.attachNewNode(LODNode("lod"))
+    near = 0
+    detail = model
+    for ratio, distance in levels:
+        detail.reparentTo(lod)
+        lod.node().addSwitch(distance, near)
+        near = distance
+        detail = decimate(model, size * ratio)
+    detail.reparentTo(lod)
+    lod.node().addSwitch(FAR, near)
+    return root
+
+
+def highest(model):
+    # A copy of model with every LODNode replaced by its most detailed level
+    copy = NodePath(model.node().copySubgraph())
+    for path in copy.findAllMatches("**/+LODNode"):
+        while path.getNumChildren() > 1:
+            path.getChild(1).removeNode()
+        path.getChild(0).reparentTo(path.getParent())
+        path.removeNode()
+    return copy
+
+
+def triangle_counts(model):
+    # Triangles of each level of the first LODNode under model, or of the
+    # whole model if it has none
+    lod = model.find("**/+LODNode")
+    levels = lod.getChildren() if not lod.isEmpty() else [model]
+    counts = []
+    for level in levels:
+        count = 0
+        for path in level.findAllMatches("**/+GeomNode"):
+            node = path.node()
+            for i in range(node.getNumGeoms()):
+                geom = node.getGeom(i).decompose()
+                count += sum(geom.getPrimitive(j).getNumPrimitives() for j in range(geom.getNumPrimitives()))
+        counts.append(count)
+    return counts
+
+
+def prepare_ghost(model):
+    return make_lod(model, GHOST_LODS)
+
+
+def prepare_monster(model):
+    return make_lod(model, MONSTER_LODS)
+
+
+# Changing the levels must not load stale ones from the model cache
+prepare_ghost.cache_key = repr(GHOST_LODS)
+prepare_monster.cache_key = repr(MONSTER_LODS)
+
+# What to prepare each model with, like sceneprep.STATIC_MODELS
+LOD_MODELS = {
+    "models/newghost.glb": prepare_ghost,
+    "models/monster_with_glowing_eyes.glb": prepare_monster,
+}
+
+
+if __name__ == "__main__":
+    # python lod.py models/newghost.glb ... reports the triangles per level
+    import sys
+    from modelcache import load_file
+    for path in sys.argv[1:]:
+        model = load_file(path)
+        prepare = LOD_MODELS.get(path, prepare_ghost)
+        print(path + ":", " -> ".join(str(count) for count in triangle_counts(prepare(model))), "triangles")
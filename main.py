@@ -2,18 +2,40 @@ from direct.showbase.ShowBase import ShowBase
 from direct.task import Task
 from direct.showbase.DirectObject import DirectObject
 from direct.controls.InputState import InputState
-from panda3d.core import CollisionTraverser, CollisionRay, BitMask32, CollisionHandlerQueue, CollisionHandlerEvent, CollisionNode, CollisionHandlerPusher, CollisionBox, Point3, CollisionSphere, LVector3, CollisionPolygon, WindowProperties, loadPrcFileData
+from panda3d.core import CollisionTraverser, CollisionNode, CollisionHandlerPusher, Point3, CollisionSphere, LVector3, WindowProperties, Camera, PerspectiveLens, loadPrcFileData
 from panda3d.ai import AIWorld, AICharacter
 import direct.gui.DirectGuiGlobals as DGG
 from direct.gui.DirectGui import *
 from direct.gui.OnscreenImage import OnscreenImage
 from direct.showbase.Transitions import Transitions
+from spatialgrid import SpatialGrid, separation_offsets
+from npcregistry import NPCRegistry
+from npcpool import NPCPool
+from prototypes import PrototypeCache, GhostInstancer
+from modelcache import ModelCache
+from loadingscreen import LoadingScreen
+from sceneprep import STATIC_MODELS
+from lod import LOD_MODELS, highest
+from flowfield import FlowField
+from aischeduler import AIScheduler
+from simclock import FixedStep
+from picking import Picker
+from collisionpartition import partition_solids
+from level import load_level, spawn_triggers
+from proximitydamage import ProximityDamage
+from spells import Shotgun, Cone, Nova
+from triggers import TriggerVolumes
+from navgrid import load_navgrid
+import layers
+from math import ceil
+import sys
+import os
 
 loadPrcFileData("", "texture-minfilter linear-mipmap-linear")
 
 class CameraControllerBehaviour(DirectObject):
     _instances = 0
-    def __init__(self, camera, velocity=9, mouse_sensitivity=0.2, initial_pos=(-0.5, -12, 7.7), showbase=None):
+    def __init__(self, camera, velocity=9, mouse_sensitivity=0.2, initial_pos=(-0.5, -12, 7.7), showbase=None, fixed_step=False, max_substep=.5):
         self._camera = camera
         self._velocity = velocity
         self._mouse_sensitivity = mouse_sensitivity
@@ -26,6 +48,11 @@ class CameraControllerBehaviour(DirectObject):
         self._prev_mouse = None
         self._showbase = base if showbase is None else showbase
         self._gravity = LVector3(0, 0, -3.8)  # Set gravity vector pointing downward
+        self._fixed_step = fixed_step
+        self._max_substep = max_substep
+        self._active = False
+        self._sim_pos = None
+        self._prev_pos = None
         self._instance = CameraControllerBehaviour._instances
         CameraControllerBehaviour._instances += 1
         self._camera.setPos(*initial_pos)
@@ -45,13 +72,15 @@ class CameraControllerBehaviour(DirectObject):
 
         self._showbase.disableMouse()
 
-        props = WindowProperties()
-        props.setCursorHidden(True)
-        props.setMouseMode(WindowProperties.MRelative)
+        if self._showbase.win is not None:
+            props = WindowProperties()
+            props.setCursorHidden(True)
+            props.setMouseMode(WindowProperties.MRelative)
 
-        self._showbase.win.requestProperties(props)
+            self._showbase.win.requestProperties(props)
 
         self._showbase.taskMgr.add(self.update, "UpdateCameraTask" + str(self._instance))
+        self._active = True
     
     def destroy(self):
         self.disable()
@@ -77,27 +106,30 @@ class CameraControllerBehaviour(DirectObject):
 
     def disable(self):
         self._showbase.taskMgr.remove("UpdateCameraTask" + str(self._instance))
+        self._active = False
 
-        props = WindowProperties()
-        props.setCursorHidden(False)
+        if self._showbase.win is not None:
+            props = WindowProperties()
+            props.setCursorHidden(False)
 
-        self._showbase.win.requestProperties(props)            
+            self._showbase.win.requestProperties(props)            
 
     def update(self, task):
         dt = globalClock.getDt()
         
-        # Get mouse movement for rotation
-        md = self._showbase.win.getPointer(0)
-        x = md.getX()
-        y = md.getY()
-        #center_x = self._showbase.win.getXSize() // 2
-        #center_y = self._showbase.win.getYSize() // 2
-
-        if self._prev_mouse is not None:
-            prev_x, prev_y = self._prev_mouse
-            self._yaw = self._yaw - (x - prev_x) * self._mouse_sensitivity
-            self._pitch = self._pitch - (y - prev_y) * self._mouse_sensitivity
-        self._prev_mouse = (x, y)
+        # Get mouse movement for rotation (there is no mouse when headless)
+        if self._showbase.win is not None:
+            md = self._showbase.win.getPointer(0)
+            x = md.getX()
+            y = md.getY()
+            #center_x = self._showbase.win.getXSize() // 2
+            #center_y = self._showbase.win.getYSize() // 2
+
+            if self._prev_mouse is not None:
+                prev_x, prev_y = self._prev_mouse
+                self._yaw = self._yaw - (x - prev_x) * self._mouse_sensitivity
+                self._pitch = self._pitch - (y - prev_y) * self._mouse_sensitivity
+            self._prev_mouse = (x, y)
 
         # Clamp the pitch to prevent camera flipping over
         self._pitch = max(-89, min(89, self._pitch))
@@ -108,40 +140,112 @@ class CameraControllerBehaviour(DirectObject):
         # Access the camera's lens and set the focal length
         lens = self._showbase.cam.node().getLens()
         lens.setFocalLength(0.25)
-        
-        # Get the camera's position
-        
-        # Calculate the position increment
-        pos_increment = self._velocity * dt
-        
-        # Handle keyboard input for movement
-        if  self._input_state.isSet('forward'):
-            self._showbase.camera.setY(self._showbase.camera, pos_increment)
-
-        if  self._input_state.isSet('backward'):
-            self._showbase.camera.setY(self._showbase.camera, -pos_increment)
-
-        if  self._input_state.isSet('left'):
-            self._showbase.camera.setX(self._showbase.camera, -pos_increment)
 
-        if  self._input_state.isSet('right'):
-            self._showbase.camera.setX(self._showbase.camera, pos_increment)
+        # With a fixed step, the owner calls step() from its simulation ticks
+        if not self._fixed_step:
+            self.step(dt)
+        return Task.cont
 
-        if  self._input_state.isSet('up'):
-            self._showbase.camera.setZ(self._showbase.camera, pos_increment)
+    def step(self, dt, collide=None):
+        # Moves the camera by one simulation step.  collide, if given, is
+        # called after moving so that collisions can push the camera back
+        # before its position is kept for interpolate().
+        # A move longer than max_substep (a long step, or a fast camera) is
+        # made in equal parts with collide() after each, so that the camera
+        # can't pass through a wall thinner than its collision sphere; the
+        # usual short moves are made in one.
+        camera = self._showbase.camera
+        if self._sim_pos is not None:
+            camera.setPos(self._sim_pos)
+        self._prev_pos = camera.getPos()
+
+        if self._active:
+            # Calculate the position increment
+            pos_increment = self._velocity * dt
+
+            # Handle keyboard input for movement
+            if  self._input_state.isSet('forward'):
+                camera.setY(camera, pos_increment)
+
+            if  self._input_state.isSet('backward'):
+                camera.setY(camera, -pos_increment)
+
+            if  self._input_state.isSet('left'):
+                camera.setX(camera, -pos_increment)
+
+            if  self._input_state.isSet('right'):
+                camera.setX(camera, pos_increment)
+
+            if  self._input_state.isSet('up'):
+                camera.setZ(camera, pos_increment)
+
+            if  self._input_state.isSet('down'):
+                camera.setZ(camera, -pos_increment)
+
+            self.cam_pos = camera.getPos(self._showbase.render)
+            # Apply gravity to the camera's position
+            (self.cam_pos) += self._gravity * min(dt, 1/30.0)
+
+            # Update the camera's position
+            camera.setPos(self.cam_pos)
+
+        if collide is not None:
+            move = camera.getPos() - self._prev_pos
+            substeps = max(1, ceil(move.length() / self._max_substep))
+            if substeps > 1:
+                camera.setPos(self._prev_pos)
+                move /= substeps
+                for i in range(substeps - 1):
+                    camera.setPos(camera.getPos() + move)
+                    collide()
+                camera.setPos(camera.getPos() + move)
+            collide()
+        self._sim_pos = camera.getPos()
+
+    def interpolate(self, alpha):
+        # Shows the camera alpha of the way from the previous step to the last
+        if self._sim_pos is None:
+            return
+        self._showbase.camera.setPos(self._prev_pos + (self._sim_pos - self._prev_pos) * alpha)
+
+    def press(self, action, pressed=True):
+        # Holds down (or lets go of) a movement key, for scripted play
+        self._input_state.set(action, pressed)
+
+    def look(self, yaw, pitch):
+        # Turns the camera as if the mouse had been moved there
+        self._yaw = yaw
+        self._pitch = max(-89, min(89, pitch))
+        self._showbase.camera.setHpr(self._yaw, self._pitch, self._roll)
 
-        if  self._input_state.isSet('down'):
-            self._showbase.camera.setZ(self._showbase.camera, -pos_increment)
-        
-        self.cam_pos = self._showbase.camera.getPos(self._showbase.render)
-        # Apply gravity to the camera's position
-        (self.cam_pos) += self._gravity * min(dt, 1/30.0)
-        
-        # Update the camera's position
-        self._showbase.camera.setPos(self.cam_pos)
-        return Task.cont
+    def teleport(self):
+        # Call after moving the camera directly, so that the next step starts
+        # from there instead of from the last simulated position.
+        self._sim_pos = None
+        self._prev_pos = None
         
 class MyApp(ShowBase):
+    separation_threshold = 3  # Minimum distance between NPCs
+    repelling_force = .3  # Strength of the repelling force
+    hardware_instancing = False  # Draw all ghosts in one call (needs GLSL 330)
+    steering_backend = "panda"  # "panda" for panda3d.ai, "numpy" for steering.SteeringWorld
+    flowfield_pathing = True  # With the numpy backend, ghosts path around the walls
+    ai_near_distance = 25  # Ghosts closer than this and on screen get AI every tick
+    ai_far_interval = 4  # Other ghosts get AI about every this many ticks (numpy backend only: AIWorld steps every ghost each tick, the scheduler only slices the copy and separation after it)
+    ai_budget = .002  # Seconds of AI per tick before far ghosts get updated less
+    tick_rate = 60  # Simulation ticks per second, independent of the frame rate
+    mana_regen = .6  # Mana per second
+    async_loading = True  # Load the models in the background behind a loading screen
+    headless = False  # No window or mouse, see headless.py
+    level_name = "mansion"  # Loaded from levels/
+    model_cache_bytes = 64 << 20  # Loaded models kept in memory, least recently used first out
+    model_cache_dir = None if sys.platform == "emscripten" else os.path.join(os.path.dirname(os.path.abspath(__file__)), "cache", "models")  # Models converted to .bam (None: off)
+    camera_substep = .5  # Longest camera move between two collision tests
+    wall_cell_size = None  # Split the walls into collision nodes per cell of this size (None: one node; pays off from about 10 colliders, see benchmark.py --walls)
+    ghost_reach = 3.25  # Ghosts this close to the camera hurt the player (their spheres touching)
+    ghost_damage = 2  # Health per second that each ghost in reach takes
+    spell = "wand"  # What a click casts: "wand" (keys 1-4 switch), "shotgun", "cone" or "nova"
+    collide_layers = True  # Put collision nodes in the layers of layers.py (False leaves Panda's default masks)
     password = ""
     haskey = False
 #    def finalboss(self):
@@ -183,7 +287,7 @@ class MyApp(ShowBase):
         return Task.cont
     def safenumpad(self):
         self.cam_controller.disable()
-        self.keymodel = self.loader.loadModel(r"models/key.glb")
+        self.keymodel = self.models.load(r"models/key.glb")
         self.keyimage = ()
         self.password = ""
         def setnumber1():
@@ -221,7 +325,7 @@ class MyApp(ShowBase):
         self.clearbutton = DirectButton(text=("clear", "clear", "clear", "disabled"), scale=.1, command=clearpassword, pos = (-.45, -10, -.6))
         def checkpassword():
             if self.password == "1234":
-                self.keymodel = self.loader.loadModel(r"models/key.glb")
+                self.keymodel = self.models.load(r"models/key.glb")
                 self.keyimage = OnscreenImage(image = r"models/key.png", pos = (-.8, 0, .8), scale = (.1, .1, .1))
                 self.haskey = True
                 self.keyimage.setTransparency(True)
@@ -231,10 +335,22 @@ class MyApp(ShowBase):
                 taskMgr.add(self.keyposupdate, "keyposupdate")
                 print("Password Correct")
         self.enterbutton = DirectButton(text=("enter", "enter", "enter", "disabled"), scale=.1, command=checkpassword, pos = (.35, -10, -.6))
-    def manaupdate(self, task):
-        self.manaamount = self.manaamount + .01
-        self.manabar['value'] = self.manaamount
-        return Task.cont
+    def opensafe(self):
+        print("safe")
+        self.safenumpad()
+    def openupstairdoor(self):
+        if self.haskey == True:
+            self.upstairdoor_collision_node.removeSolid(0)
+    def manaupdate(self, dt):
+        self.manaamount = self.manaamount + self.mana_regen * dt
+    def setlayers(self, node, into, from_mask=None):
+        # Puts a CollisionNode in the given layers, and makes it test only
+        # from_mask if it is a collider
+        if not self.collide_layers:
+            return
+        node.setIntoCollideMask(into)
+        if from_mask is not None:
+            node.setFromCollideMask(from_mask)
     def death(self):    
         transitions = Transitions(loader=self.render)
         transitions.fadeOut(t=1)
@@ -245,13 +361,8 @@ class MyApp(ShowBase):
         def reset():
             Deathscreen.destroy()
             respawnbutton.destroy()
-            npctoremove = []
-            for npc in self.npcs:
-                if not self.npcs[npc].isEmpty():
-                    npctoremove.append(npc)
-            for npc in npctoremove:
-                self.npcs[npc].removeNode()
-                del self.npcs[npc]
+            for npc_id in self.npcs.alive_ids():
+                self.despawnnpc(npc_id)
             self.died = False
             self.healthpoints = 100
             self.crosshair = OnscreenImage(
@@ -262,125 +373,109 @@ class MyApp(ShowBase):
             self.crosshair.setTransparency(True)
             self.cam_controller.setup()
             self.camera.setPos(0, -18, 14)
+            self.cam_controller.teleport()
         respawnbutton = DirectButton(text=("respawn", "fine", "do you really?", "disabled"),
             scale=.1, command=reset, pos = (0, -10, -.8))           
-    def spawnatdoors(self, task):
-        self.b=2
-        if task.time < 1.8:
-            return Task.cont
-        if (round(self.camera.getX()) == -1) and (round(self.camera.getY()) == -34):
-
-            self.spawnnpcs(self.b, -.8, -34)
-        if (round(self.camera.getX()) == 14) and (round(self.camera.getY()) == -49):
-
-            self.spawnnpcs(self.b, 14, -49)
-        if (round(self.camera.getX()) == -15) and (round(self.camera.getY()) == -20):
-            self.spawnnpcs (self.b, -15, -21)
-        if (round(self.camera.getX()) == -21) and (round(self.camera.getY()) == -16):
-
-            self.spawnnpcs(self.b, -21, -16)
-        if (round(self.camera.getX()) == -33) and (round(self.camera.getY()) == -49):
-
-            self.spawnnpcs(self.b, -33, -49)
-        if (round(self.camera.getX()) == 32) and (round(self.camera.getY()) == -25):
-
-            self.spawnnpcs(self.b, 32, -25)
-        return Task.cont
     def click(self):
-        props = self.win.getProperties()
-        if not props.getForeground() or not props.getCursorHidden() or props.getMouseMode() != WindowProperties.MRelative:
-            self.win.requestProperties(WindowProperties(foreground=True, mouse_mode=WindowProperties.MRelative, cursor_hidden=True))
-
-        # Create a CollisionRay for the wand
-        ray_node = CollisionNode('wand-ray')
-        ray = CollisionRay()
-        ray.setOrigin(0, 0, 0)  # Start at the camera
-        ray.setDirection(0, 1, 0)  # Point forward
-        ray_node.addSolid(ray)
-
-        ray_path = self.camera.attachNewNode(ray_node)
-        ray_node.setFromCollideMask(BitMask32.bit(0))
-        ray_node.setIntoCollideMask(BitMask32.allOff())
+        if self.win is not None:
+            props = self.win.getProperties()
+            if not props.getForeground() or not props.getCursorHidden() or props.getMouseMode() != WindowProperties.MRelative:
+                self.win.requestProperties(WindowProperties(foreground=True, mouse_mode=WindowProperties.MRelative, cursor_hidden=True))
 
-        collision_queue = CollisionHandlerQueue()
-        self.cTrav.addCollider(ray_path, collision_queue)
+        if self.spell != "wand":
+            self.cast(self.spells[self.spell])
+            return
 
-        # Perform collision traversal
-        self.cTrav.traverse(self.render)
+        # Cast the wand ray at the ghosts and interactables; walls block it
+        entry = self.picker.pick(self.pickables, self.wall_collision_node_path)
 
         try:
             # Process collisions
-            num_collisions = collision_queue.getNumEntries()
-
-            if num_collisions > 1:
-                collision_queue.sortEntries()
-                entry = collision_queue.getEntry(1)  # Get the closest collision
+            if entry is not None:
                 hit_node = entry.getIntoNode()
-                if hit_node == self.safe_node:
-                    print("safe")
-                    self.safenumpad()
-                if hit_node == self.upstairdoor_collision_node and self.haskey == True:
-                    self.upstairdoor_collision_node.removeSolid(0)
+                interact = self.interactables.get(hit_node)
+                if interact is not None:
+                    interact()
                 # Find the ghost that was hit
-                ghosts_to_remove = []  # Queue for ghosts to remove
-                for ghost_name, ghost in self.npcs.items():
-                    ghost_node = ghost.find("**/+CollisionNode")
-                    if not ghost_node.isEmpty() and ghost_node.node() == hit_node:
-                        if not ghost.isEmpty():
-                            ghosts_to_remove.append(ghost_name)
-
-                # Remove ghosts after processing collisions
-                if self.manaamount > 0:
-                    for ghost_name in ghosts_to_remove:
-                        if ghost_name in self.npcs:
-                            self.npchealths[ghost_name] -= 1
-                            print(f"{ghost_name} hit!")
-                            self.manaamount -= 3
+                npc_id = self.npcs.find(hit_node)
+                if npc_id is not None and self.manaamount > 0:
+                    self.npcs.damage(npc_id, 1)
+                    print(f"npc{npc_id} hit!")
+                    self.manaamount -= 3
 
         except AssertionError as e:
             print("AssertionError occurred during collision processing.")
             print(e)
-
-        # Cleanup
-        self.cTrav.removeCollider(ray_path)  # Remove collider from traverser
-        ray_path.removeNode()  # Safely remove the ray
-        collision_queue.clearEntries()  # Clear the queue
+    def cast(self, spell):
+        # Damages every ghost the spell finds (once per hit) for one cost of mana
+        if self.manaamount <= 0:
+            return
+        npcs = self.npcs
+        for npc_id in spell.targets(self):
+            npcs.damage(npc_id, spell.damage)
+        self.manaamount -= spell.cost
+    def setspell(self, spell):
+        self.spell = spell
+    def makenpc(self):
+        npc_name = self.npcpool.new_name()
+        npc = self.pickables.attachNewNode(npc_name)
+        if self.ghostinstancer is None:
+            self.prototypes.instance(r"models/newghost.glb", npc)
+        npc.setScale(2,2,2)
+        collider = CollisionNode(npc_name)
+        collider.addSolid(CollisionSphere(0, 0, 0, 1))
+        self.setlayers(collider, layers.GHOST)
+        if self.steering_backend == "numpy":
+            # The steering world moves the ghosts itself, no AI proxy needed
+            return npc, None, None, None, npc.attachNewNode(collider)
+        aidot = self.render.attachNewNode(npc_name + "-aidot")
+        self.prototypes.instance(r'models/aidotupdater.glb', aidot)
+        aichar = AICharacter(npc_name, aidot, 100, 0.05, 5)
+        self.Aiworld.addAiChar(aichar)
+        behaviors = aichar.getAiBehaviors()
+        return npc, aidot, aichar, behaviors, npc.attachNewNode(collider)
     def spawnnpcs(self, num_npcs, posx, posy):
-        for a in range(self.b):
-            i = self.i
-            self.i += 1
-            npc_name = f"npc{i}"
-            aidotname = f"aidot{i}"
-            aicharname = f"aichar{i}"
-            aicharbehaviorname = f"aibehavior{i}"
-            collidername = f"collider{i}"
-            self.npchealths[npc_name] = 3
-            self.npcs[npc_name] = self.loader.loadModel(r"models/newghost.glb")
-            self.aidotdict[aidotname] = self.loader.loadModel(r'models/aidotupdater.glb')
-            self.aidotdict[aidotname].reparentTo(self.render)
-            self.npcs[npc_name].reparentTo(self.render)
-            self.npcs[npc_name].setPos(posx+i, posy+i, 10)
-            self.aidotdict[aidotname].setPos(posx+i, posy+i, 10)
-            self.npcs[npc_name].lookAt(self.camera)
-            self.npcs[npc_name].setHpr(0,90,0)
-            self.npcs[npc_name].setScale(2,2,2)
-            self.colliderdict[collidername] = CollisionNode(npc_name)
-            self.colliderdict[collidername].addSolid(CollisionSphere(0, 0, 0, 1))
-            self.Aichardict[aicharname] = AICharacter(f"npc{i}", self.aidotdict[aidotname], 100, 0.05, 5)
-            self.Aiworld.addAiChar(self.Aichardict[aicharname])
-            self.Aicharbehaviorsdict[aicharbehaviorname] = self.Aichardict[aicharname].getAiBehaviors()
-            self.Aicharbehaviorsdict[aicharbehaviorname].pursue(self.camera)
-            self.Aicharbehaviorsdict[aicharbehaviorname].arrival(7) #arrival
-            self.npcColliderpath = self.npcs[npc_name].attachNewNode(self.colliderdict[collidername])
-        self.i = 0
-        self.cTrav.addCollider(self.npcColliderpath, self.npcintocam)
+        for i in range(num_npcs):
+            ghost = self.npcpool.acquire()
+            if ghost is None:
+                ghost = self.makenpc()
+            npc, aidot, aichar, behaviors, collider = ghost
+            npc.unstash()
+            npc.setPos(posx+i, posy+i, 10)
+            npc.lookAt(self.camera)
+            npc.setHpr(0,90,0)
+            if self.steering_backend != "numpy":
+                aidot.unstash()
+                aidot.setPos(posx+i, posy+i, 10)
+                behaviors.pursue(self.camera)
+                behaviors.arrival(7) #arrival
+            npc_id = self.npcs.add(*ghost, 3)
+            self.aischeduler.reset(npc_id)
+            if self.steering_backend == "numpy":
+                self.Aiworld.start(npc_id)
+    def npcstats(self):
+        stats = self.npcpool.stats()
+        stats["active"] = len(self.npcs)
+        stats["model_loads"] = self.prototypes.loads
+        stats["model_cache"] = self.models.stats()
+        return stats
+    def despawnnpc(self, npc_id):
+        # Park the ghost so the next wave can reuse it
+        npcs = self.npcs
+        if self.steering_backend == "numpy":
+            self.Aiworld.stop(npc_id)
+        else:
+            npcs.behaviors[npc_id].removeAi("all")
+            npcs.aidots[npc_id].stash()
+        npcs.nodes[npc_id].stash()
+        self.npcpool.release((npcs.nodes[npc_id], npcs.aidots[npc_id], npcs.aichars[npc_id], npcs.behaviors[npc_id], npcs.colliders[npc_id]))
+        npcs.remove(npc_id)
     def loadmodels(self):
-        self.npcs = {}
-        self.aidotdict = {}
-        self.Aichardict = {}
-        self.Aicharbehaviorsdict = {}
-        self.colliderdict = {}
-        self.npchealths = {}
+        self.npcs = NPCRegistry()
+        self.npcpool = NPCPool()
+        self.models = ModelCache(self.loader, self.model_cache_bytes, self.model_cache_dir, dict(STATIC_MODELS, **LOD_MODELS))
+        self.prototypes = PrototypeCache(self.models)
+        self.ghostinstancer = None
         self.healthpoints=100
         self.manaamount=100
         self.bar = DirectWaitBar(text="HP", value=100, pos=(-.5, -15, -.8))
@@ -400,146 +495,153 @@ class MyApp(ShowBase):
             scale=0.05       # Adjust scale for size
         )
         self.crosshair.setTransparency(True) 
-        self.Manor = self.loader.loadModel(r"models/HauntedMansion.glb")
-        self.Manor.reparentTo(self.render)
-        self.Manor.setHpr(90, 90, 90)
-        self.cameramodel = self.loader.loadModel(r'models/aidotupdater.glb')
-        self.cameramodel.reparentTo(self.camera)
-        self.wand = self.loader.loadModel("models/basic_wand.glb")
-        self.wand.reparentTo(self.render)
-        self.wand.setScale(.1, .1, .1)
-        self.cameramodel.setPos(0, -18, 8)
         self.camera.setPos(0, -18, 8)
+        # Everything the wand can hit lives under pickables
+        self.pickables = self.render.attachNewNode('pickables')
+        self.picker = Picker(self.camera)
+        self.setlayers(self.picker.node, layers.PICKRAY, layers.PICKRAY_COLLIDES)
+        self.spells = {"shotgun": Shotgun(self.camera), "cone": Cone(), "nova": Nova()}
+        for node in self.spells["shotgun"].picker.nodes:
+            self.setlayers(node, layers.PICKRAY, layers.PICKRAY_COLLIDES)
+        # What happens when the wand hits a collision node that isn't a ghost
+        self.interactables = {}
         # Create a collision traverser
         self.cTrav = CollisionTraverser()
         # Create a collision handler
         self.pusher = CollisionHandlerPusher()
         self.pusher.addInPattern("%fn-into-wall")
-        for npc, collidername in zip(self.npcs.values(), self.colliderdict.values()):
-                self.npcColliderpath = npc.attachNewNode(collidername)
-        self.npcintocam = CollisionHandlerEvent()
-        self.npcintocam.addInPattern('into-camera')
         # Create a collision node for the camera
         camera_collision_node = CollisionNode('camera')
         camera_collision_node.addSolid(CollisionSphere(0, 0, 0, 1.25))
+        self.setlayers(camera_collision_node, layers.PLAYER, layers.PLAYER_COLLIDES)
         camera_collision_node_path = self.camera.attachNewNode(camera_collision_node)
         self.cTrav.addCollider(camera_collision_node_path, self.pusher) 
         self.pusher.addCollider(camera_collision_node_path, self.camera)
-    def Dmgbynpc(self, task):
-        print('damage')
-        self.healthpoints-=1
-        print(self.healthpoints)
+    def loadassets(self):
+        # Loads the models in the background behind a loading screen, or all
+        # at once with async_loading off; start() is called when all are in
+        paths = [r"models/HauntedMansion.glb", r'models/aidotupdater.glb', "models/basic_wand.glb", r"models/newghost.glb"]
+        self.assets = {}
+        self.loadingscreen = LoadingScreen(len(paths))
+        for path in paths:
+            if self.async_loading:
+                self.models.request(path, lambda model, path=path: self.assetloaded(path, model))
+            else:
+                self.assetloaded(path, self.models.get(path))
+    def assetloaded(self, path, model):
+        self.assets[path] = model
+        self.loadingscreen.advance(os.path.basename(path))
+        if len(self.assets) == self.loadingscreen.total:
+            self.start()
+    def start(self):
+        # Every model is in: put them in the scene and start the game
+        self.loadingscreen.destroy()
+        # Built from the models just loaded, not from the model cache, which
+        # may have let some of them go again; copied, since the loaded ones
+        # are the cached ones
+        assets = self.assets
+        self.assets = {}
+        # Turned (90, 90, 90) and flattened when loaded, see sceneprep.py
+        self.Manor = assets[r"models/HauntedMansion.glb"].copyTo(self.render)
+        self.cameramodel = assets[r'models/aidotupdater.glb'].copyTo(self.camera)
+        self.wand = assets["models/basic_wand.glb"].copyTo(self.render)
+        self.wand.setScale(.1, .1, .1)
+        self.prototypes.add(r"models/newghost.glb", assets[r"models/newghost.glb"])
+        self.cameramodel.setPos(0, -18, 8)
+        if self.hardware_instancing:
+            # One draw call for every ghost leaves no room for levels of detail
+            self.ghostinstancer = GhostInstancer(highest(self.prototypes.get(r"models/newghost.glb")), self.render)
+        #AI World updated
+        taskMgr.add(self.Update,"Update")
+    def playerhit(self, hits, damage):
+        # hits ghosts were in reach during the last tick
+        self.healthpoints -= damage
     def createwalls(self):
-        self.wall_collision_node = CollisionNode('wall')
-        self.upstairdoor_collision_node = CollisionNode('upstairdoor')
-        self.upstairdoor_collision_node.addSolid(CollisionBox(Point3(14, -9.5, 9), .5, 8, 4))
-        self.upstairdoor_collision_node_path = self.render.attachNewNode(self.upstairdoor_collision_node)
-        self.wall_collision_node.addSolid(CollisionBox(Point3(22, -6.5, 32), 19, .5, 27))
-        self.wall_collision_node.addSolid(CollisionBox(Point3(-23.5, -6.5, 32), 19, .5, 27))
-        self.wall_collision_node.addSolid(CollisionBox(Point3(0, -6.5, 35), 10, .5, 25))
-        self.wall_collision_node.addSolid(CollisionBox(Point3(0, -63, 30), 48, .5, 27))
-        self.wall_collision_node.addSolid(CollisionBox(Point3(41, -35, 32), .5, 28, 27))
-        self.wall_collision_node.addSolid(CollisionBox(Point3(-43, -35, 32), .5, 28, 27))
-        self.wall_collision_node.addSolid(CollisionBox(Point3(0, -35, 2), 43, 28, 4.5))
-        self.wall_collision_node.addSolid(CollisionBox(Point3(0, 0, 0), 15, 7, 2))
-        self.wall_collision_node.addSolid(CollisionBox(Point3(14, -32, 9), .3, 15, 4))
-        self.wall_collision_node.addSolid(CollisionBox(Point3(-17.5, -15, 9), 1.5, .3, 4))
-        self.wall_collision_node.addSolid(CollisionBox(Point3(-25, -15, 9), 1.7, .3, 4))
-        self.wall_collision_node.addSolid(CollisionBox(Point3(-15.75, -12.5, 9), .3, 6, 4))
-        self.wall_collision_node.addSolid(CollisionBox(Point3(-15.75, -34, 9), .3, 11.5, 4))
-        self.wall_collision_node.addSolid(CollisionBox(Point3(-15.75, -57.5, 9), .3, 5, 4))
-        self.wall_collision_node.addSolid(CollisionBox(Point3(14, -56.5, 9), .3, 6, 4))
-        self.wall_collision_node.addSolid(CollisionBox(Point3(13, -35, 9), 10, .3, 4))
-        self.wall_collision_node.addSolid(CollisionBox(Point3(-23, -35, 9), 19, .3, 4))
-        self.wall_collision_node.addSolid(CollisionBox(Point3(-25, -10, 9), .3, 5, 4))
-        self.wall_collision_node.addSolid(CollisionBox(Point3(-33,-41, 9), .3, 5.5, 4))
-        self.wall_collision_node.addSolid(CollisionBox(Point3(-33,-52.5, 9), .3, 2, 4))
-        self.wall_collision_node.addSolid(CollisionBox(Point3(-38,-55, 9), 5, .3, 4))
-        self.wall_collision_node.addSolid(CollisionBox(Point3(23, -20.5, 9), .3, 14.5, 4))
-        self.wall_collision_node.addSolid(CollisionBox(Point3(27, -25, 9), 3.5, .3, 4))
-        self.wall_collision_node.addSolid(CollisionBox(Point3(37.5, -25, 9), 3.5, .3, 4))
-        self.wall_collision_node.addSolid(CollisionBox(Point3(-13, -9, 7), 1, 1, 1))
-        self.wall_collision_node.addSolid(CollisionBox(Point3(8.5, -33, 6), 4.5, 1, .75))
-        self.wall_collision_node.addSolid(CollisionBox(Point3(-10, -33, 6), 4.5, 1, .75))
-        self.wall_collision_node.addSolid(CollisionBox(Point3(-17.5, -30, 6), 1, 4, 4))
-        self.wall_collision_node.addSolid(CollisionBox(Point3(-36, -34.25, 6), 6, 3.25, .75))
-        self.wall_collision_node.addSolid(CollisionBox(Point3(-38.75, -25.5 , 6), 4, 1.25, .75))
-        self.wall_collision_node.addSolid(CollisionBox(Point3(-40, -12 , 6), 2, 4, .75))
-        self.wall_collision_node.addSolid(CollisionBox(Point3(-28, -11 , 6), 1, 1, 1))
-        self.wall_collision_node.addSolid(CollisionBox(Point3(-18, -11 , 6), 1, 1, 1))
-        self.wall_collision_node.addSolid(CollisionBox(Point3(-34.5, -41.4 , 6), 1, 3.6, .75))
-        self.wall_collision_node.addSolid(CollisionBox(Point3(-42, -54 , 6), 1.5, 1.5, 1))
-        self.wall_collision_node.addSolid(CollisionBox(Point3(-25.75, -40, 6), .75, .5, .75))
-        self.wall_collision_node.addSolid(CollisionBox(Point3(-22.5, -40, 6), .75, .5, .75))
-        self.wall_collision_node.addSolid(CollisionBox(Point3(-25.75, -46, 6), .75, .5, .75))
-        self.wall_collision_node.addSolid(CollisionBox(Point3(-22.5, -46, 6), .75, .5, .75))
-        self.wall_collision_node.addSolid(CollisionBox(Point3(-24.25, -42.75, 6), 3.5, 1.5, .75))
-        self.wall_collision_node.addSolid(CollisionBox(Point3(-18, -58, 6), 1, 5, .75))
-        self.wall_collision_node.addSolid(CollisionBox(Point3(-42, -59, 6), 1, 3, .75))
-        self.wall_collision_node.addSolid(CollisionBox(Point3(-11, -37, 6), 5, 1, .75))
-        self.wall_collision_node.addSolid(CollisionBox(Point3(12, -37, 6), 1, 1.5, .75))
-        self.wall_collision_node.addSolid(CollisionBox(Point3(11.25, -61.5, 6), 3.25, 1.5, .75))
-        self.wall_collision_node.addSolid(CollisionBox(Point3(-13.5, -61, 6), 1, 1.5, .75))
-        self.wall_collision_node.addSolid(CollisionBox(Point3(-1, -55, 6), 4.75, 2, .75))
-        self.wall_collision_node.addSolid(CollisionBox(Point3(6, -49, 6), 2, 1.5, .75))
-        self.wall_collision_node.addSolid(CollisionBox(Point3(-7, -49, 6), 2, 1.5, .75))
-        self.wall_collision_node.addSolid(CollisionBox(Point3(-.8, -49.25, 6), 2, 1.5, .75))
-        self.wall_collision_node.addSolid(CollisionBox(Point3(-.75, -43, 6), 4.5, 1.75, .75))
-        self.wall_collision_node.addSolid(CollisionBox(Point3(15.8, -59.5, 6), .8, 2.95, .75))
-        self.wall_collision_node.addSolid(CollisionBox(Point3(23, -58.7, 6), 2.3, 4, .75))
-        self.wall_collision_node.addSolid(CollisionBox(Point3(39, -58.5, 6), 1.6, 4.2, .75))
-        self.wall_collision_node.addSolid(CollisionBox(Point3(39, -40.4, 6), 1.6, 13.155, .75))
-        self.wall_collision_node.addSolid(CollisionBox(Point3(17.75, -36, 6), 2.95, 1.5, .75))
-        self.wall_collision_node.addSolid(CollisionBox(Point3(25, -29.5, 6), 1.3, 2.95, .75))
-        self.wall_collision_node.addSolid(CollisionBox(Point3(24.5, -21, 6), .7, 1, .75))
-        self.wall_collision_node.addSolid(CollisionBox(Point3(26.1, -12.75, 6), 2.8, 1.4, .75))
-        self.wall_collision_node.addSolid(CollisionBox(Point3(24.5, -21, 6), .7, 1, .75))
-        self.wall_collision_node.addSolid(CollisionBox(Point3(39.5, -10, 6), 1, 1, .75))
-        self.wall_collision_node.addSolid(CollisionBox(Point3(39.5, -20.4, 6), 1, 2.5, .75))
-        self.wall_collision_node.addSolid(CollisionPolygon(Point3(14.7, -15, 5), Point3(14.7, -32, 19.2), Point3(22.9, -32, 19.2), Point3(22.9, -15, 5)))
-        self.wall_collision_node.addSolid(CollisionBox(Point3(-16, -35, 14), 31, 28, 4.95))
-        self.wall_collision_node.addSolid(CollisionBox(Point3(28, -47.5, 14), 13.5, 15.5, 4.95))
-        self.wall_collision_node.addSolid(CollisionBox(Point3(32, -18.51, 14), 10, 13.5, 5))
-        self.wall_collision_node.addSolid(CollisionPolygon(Point3(22, -29, 19.2), Point3(22, -33, 19.2), (50, -33, 19.2),Point3(50, -29, 19.2)))
-        self.wall_collision_node.addSolid(CollisionPolygon(Point3(13.7, -32, 19.2), Point3(13.7, -67, 19.2), Point3(22.9, -67, 19.2), Point3(22.9, -32, 19.2)))
-        self.wall_collision_node.addSolid(CollisionBox(Point3(-10.8, -35, 21), 15.2, 5.9, .75))
-        self.wall_collision_node.addSolid(CollisionBox(Point3(6, -35, 21), 2, 4.5, .75))
-        self.wall_collision_node.addSolid(CollisionBox(Point3(-28, -35, 21), 2, 4.5, .75))
-        self.wall_collision_node.addSolid(CollisionPolygon(Point3(14.7, -32, 19.2), Point3(14.7, -36, 26), Point3(19, -36, 26), Point3(19, -32, 19.2)))
-        self.wall_collision_node.addSolid(CollisionPolygon(Point3(10, -36, 34), Point3(10, -40, 34), Point3(17, -40, 26), Point3(14, -36, 26)))
-        self.wall_collision_node.addSolid(CollisionPolygon(Point3(10, -29, 40), Point3(10, -39, 34), Point3(13.5, -36, 29), Point3(13.5, -29, 42)))
-        self.wall_collision_node.addSolid(CollisionPolygon(Point3(12, -27, 39), Point3(12, -32, 37), Point3(19, -34, 46), Point3(19, -28, 46)))
-        self.wall_collision_node.addSolid(CollisionPolygon(Point3(14, -31, 42), Point3(17, -37, 49), Point3(19, -37, 49), Point3(19, -31, 46)))
-        self.wall_collision_node.addSolid(CollisionPolygon(Point3(19, -32, 19.2), Point3(19, -36, 26), Point3(20.5, -36, 26), Point3(20.5, -32, 19.2)))
-        self.wall_collision_node.addSolid(CollisionPolygon(Point3(14, -36, 26), Point3(17, -40, 28), Point3(20.5, -36, 26)))
-        self.wall_collision_node.addSolid(CollisionPolygon(Point3(9, -37, 33), Point3(13, -40, 31), Point3(14, -36, 26)))
-        self.wall_collision_node.addSolid(CollisionPolygon(Point3(12.2, -28, 39), Point3(13.5, -36, 29), Point3(16, -33, 41.5)))
-        self.wall_collision_node.addSolid(CollisionBox(Point3(19, -37.75, 20), 2, 3, 3))
-        self.wall_collision_node.addSolid(CollisionBox(Point3(16, -38.5, 20), 3, 3.5, 3))
-        self.wall_collision_node.addSolid(CollisionPolygon(Point3(20.5, -32, 19.2), Point3(20.5, -36, 26), Point3(20.5, -36, 29.2), Point3(20.5, -32, 26)))
-        self.wall_collision_node.addSolid(CollisionPolygon(Point3(10, -40, 34), Point3(10, -40, 39), Point3(17, -40, 29.2), Point3(17, -40, 26)))
-        self.wall_collision_node.addSolid(CollisionPolygon(Point3(17, -40, 26), Point3(17, -40, 29.2), Point3(20.5, -36, 29.2), Point3(20.5, -36, 26)))
-        self.wall_collision_node.addSolid(CollisionPolygon(Point3(8.75, -37, 32), Point3(8.75, -37, 39), Point3(10, -40, 39), Point3(10, -40, 34)))
-        self.wall_collision_node.addSolid(CollisionPolygon(Point3(10, -29, 40), Point3(10, -29, 46), Point3(8.75, -37, 39), Point3(8.75, -37, 32)))
-        self.wall_collision_node.addSolid(CollisionPolygon(Point3(12, -27, 40), Point3(12, -27, 46), Point3(10, -29, 46), Point3(10, -29, 40)))
-        self.wall_collision_node.addSolid(CollisionPolygon(Point3(19, -28, 46), Point3(19, -28, 52), Point3(12, -27, 46), Point3(12, -27, 40)))
-        self.wall_collision_node.addSolid(CollisionPolygon(Point3(19, -28, 46), Point3(19, -34, 46), Point3(19, -34, 52), Point3(19, -28, 52)))
-        self.wall_collision_node.addSolid(CollisionBox(Point3(14.6, -33.75, 17), .7, .7, 25))
-
-        self.wall_collision_node_path = self.render.attachNewNode(self.wall_collision_node)
+        # Walls, ramps, doors, the safe and the spawn points are described in
+        # levels/<level_name>.json (compiled to .bam by freezify.py)
+        self.level = load_level(self.loader, self.level_name)
+        self.wall_collision_node = self.level.find("wall").node()
+        self.setlayers(self.wall_collision_node, layers.WORLD)
+        self.upstairdoor_collision_node_path = self.level.find("upstairdoor")
+        self.upstairdoor_collision_node_path.reparentTo(self.pickables)
+        self.upstairdoor_collision_node = self.upstairdoor_collision_node_path.node()
+        self.setlayers(self.upstairdoor_collision_node, layers.WORLD | layers.INTERACTABLE)
+        self.interactables[self.upstairdoor_collision_node] = self.openupstairdoor
+        self.safe_node_path = self.level.find("safe")
+        self.safe_node_path.reparentTo(self.pickables)
+        self.safe_node = self.safe_node_path.node()
+        self.setlayers(self.safe_node, layers.INTERACTABLE)
+        self.interactables[self.safe_node] = self.opensafe
+        # Walking into a door's trigger brings in its ghosts
+        self.triggers = TriggerVolumes(self.cTrav, self.camera)
+        self.spawns = spawn_triggers(self.level)
+        for trigger, x, y, ghosts, cooldown in self.spawns:
+            self.triggers.add(trigger, self.spawnnpcs, args=(ghosts, x, y), cooldown=cooldown)
+        self.level.find("spawns").reparentTo(self.render)
+
+        # Optionally split into smaller nodes that the traverser can cull
+        # (they keep the layers set above)
+        self.wall_collision_node_path = partition_solids(self.wall_collision_node, self.render, self.wall_cell_size)
     def set(self):
-        self.Aiworld = AIWorld(self.render)
-        self.i = 0
+        if self.steering_backend == "numpy":
+            # Imported here so that numpy is only needed when it is used
+            from steering import SteeringWorld
+            self.Aiworld = SteeringWorld(self.npcs, self.camera, self.render, height=8,
+                                         separation_threshold=self.separation_threshold,
+                                         repelling_force=self.repelling_force)
+        else:
+            self.Aiworld = AIWorld(self.render)
+        self.npcgrid = SpatialGrid(self.separation_threshold)
+        self.aischeduler = AIScheduler(self.ai_near_distance, self.ai_far_interval, self.ai_budget)
+        self.simclock = FixedStep(self.tick_rate)
+        self.proximitydamage = ProximityDamage(self.npcs, self.ghost_reach, self.ghost_damage)
+        # Collisions are traversed in tick(), not once per frame by ShowBase
+        self.taskMgr.remove('collisionLoop')
         self.died = False
-        self.safe_node = CollisionNode('safe')
-        self.safe_node.addSolid(CollisionBox(Point3(-28, -11 , 6), 1, 1, 1))
-        self.safe_node_path = self.render.attachNewNode(self.safe_node)
-        self.safe_node_path.show()
-        #AI World updated
-        taskMgr.add(self.Update,"Update")
-        taskMgr.add(self.spawnatdoors,"spawnatdoors")
-        taskMgr.add(self.manaupdate,"manaupdate")
+    def isinview(self, x, y, z):
+        return self.camNode.isInView(self.cam.getRelativePoint(self.render, Point3(x, y, z)))
+    def updatenpcs(self, camera_position):
+        # Only the ghosts picked by the AI scheduler are moved this tick
+        npc_ids = self.npcs.alive_ids()
+        update_ids, steps = self.aischeduler.schedule(self.npcs, npc_ids, camera_position, self.isinview)
+        self.aischeduler.begin()
+        if self.steering_backend == "numpy":
+            self.Aiworld.update(update_ids, steps)
+        else:
+            self.npcs.pull_from_aidots(update_ids, 8)
+            # Separation logic to prevent NPC overlap
+            npc_positions = [self.npcs.get_pos(npc_id) for npc_id in update_ids]
+            offsets = separation_offsets(npc_positions, self.separation_threshold, self.repelling_force, self.npcgrid)
+            for npc_id, offset in zip(update_ids, offsets):
+                if offset is not None:
+                    self.npcs.offset(npc_id, *offset)
+            self.Aiworld.update()
+        self.npcs.push_to_nodes(update_ids)
+        self.aischeduler.end(len(update_ids))
+    def tick(self, dt):
+        # One fixed simulation step: camera movement and collisions, AI,
+        # damage from the ghosts in reach and mana
+        self.npcs.save_previous()
+        self.cam_controller.step(dt, collide=lambda: self.cTrav.traverse(self.render))
+        camera_position = self.camera.getPos(self.render)
+        self.updatenpcs(camera_position)
+        self.proximitydamage.update(camera_position[0], camera_position[1], camera_position[2], dt)
+        self.manaupdate(dt)
+        for npc_id in self.npcs.dead_ids():
+            self.despawnnpc(npc_id)
     def Update(self,task):
+        ticks = self.simclock.advance(globalClock.getDt())
+        if ticks:
+            # The ticks see the ghosts where they are, not where they are drawn
+            self.npcs.push_to_nodes(self.npcs.alive_ids())
+        for i in range(ticks):
+            self.tick(self.simclock.step)
+        # Drawn between the last two ticks
+        self.cam_controller.interpolate(self.simclock.alpha)
+        npc_ids = self.npcs.alive_ids()
+        self.npcs.interpolate(npc_ids, self.simclock.alpha)
+        if self.ghostinstancer is not None:
+            self.ghostinstancer.update(self.npcs, npc_ids, self.simclock.alpha)
         camera_forward = self.camera.getQuat(self.render).getForward()
         camera_up = self.camera.getQuat(self.render).getUp()
         camera_right = self.camera.getQuat(self.render).getRight()
@@ -555,53 +657,21 @@ class MyApp(ShowBase):
         self.wand.setPos(wand_position)
         self.wand.setHpr(self.camera.getH(), 60, 10)  
         # Set the wand's orientation to be vertical
-        def update_npc_position(npc, aidot):
-            npc.setH(aidot.getH())
-            aidot.setZ(8)
-            npc.setPos(aidot.getPos())
-        for npc, aidot in zip(self.npcs.values(), self.aidotdict.values()):
-            if not npc.isEmpty() and not aidot.isEmpty():
-                update_npc_position(npc, aidot)
-        # Separation logic to prevent NPC overlap
-            separation_threshold = 3  # Minimum distance between NPCs
-            repelling_force = .3  # Strength of the repelling force
-            npc_positions = {name: npc.getPos(self.render) for name, npc in self.npcs.items() if not npc.isEmpty()}
-            for name_a, pos_a in npc_positions.items():
-                for name_b, pos_b in npc_positions.items():
-                    if name_a != name_b:
-                        distance = (pos_a - pos_b).length()
-                        if distance < separation_threshold:
-                        # Calculate repelling direction
-                            direction = pos_a - pos_b
-                            direction.normalize()
-                        # Apply the repelling force
-                            new_pos = pos_a + direction * repelling_force
-                            self.npcs[name_a].setPos(new_pos)
         self.bar['value'] = self.healthpoints
+        self.manabar['value'] = self.manaamount
 
         if self.healthpoints < 0 and self.died == False:
-            self.death()
             self.died = True
-        self.Aiworld.update()
-        npcs_to_remove = []
-        for key, health in self.npchealths.items():
-            if health == 0:
-                npcs_to_remove.append(key)
-        for health in npcs_to_remove:
-            self.npcs[health].removeNode()
-            self.aidotdict[('aidot')+health[-1:]].removeNode()
-            self.Aiworld.removeAiChar(('aichar')+health[-1:])
-            self.Aicharbehaviorsdict['aibehavior'+health[-1:]].removeAi(('aibehavior')+health[-1:])
-            del self.npcs[health]
-            del self.aidotdict[('aidot')+health[-1:]]
-            del self.Aichardict[('aichar')+health[-1:]]
-            del self.Aicharbehaviorsdict[('aibehavior')+health[-1:]]
-            del self.colliderdict[('collider')+health[-1:]]
-            del self.npchealths[health]
+            self.death()
         return Task.cont
     def __init__(self):
-        super().__init__()
-        self.cam_controller = CameraControllerBehaviour(self.camera, velocity=9, mouse_sensitivity=.2)
+        super().__init__(windowType='none' if self.headless else None)
+        if self.headless:
+            # Without a window ShowBase makes no camera, but the game needs one
+            self.camera = self.render.attachNewNode('camera')
+            self.camNode = Camera('cam', PerspectiveLens())
+            self.cam = self.camera.attachNewNode(self.camNode)
+        self.cam_controller = CameraControllerBehaviour(self.camera, velocity=9, mouse_sensitivity=.2, fixed_step=True, max_substep=self.camera_substep)
         self.cam_controller.setup(keys={'w':"forward",
             's':"backward",
             'a':"left",
@@ -611,8 +681,16 @@ class MyApp(ShowBase):
         self.loadmodels()
         self.set()
         self.accept('mouse1', self.click)
-        self.accept('into-camera', self.Dmgbynpc)
+        for key, spell in zip("1234", ("wand", "shotgun", "cone", "nova")):
+            self.accept(key, self.setspell, [spell])
+        self.accept('player-hit', self.playerhit)
         # Create a collision node for a wall
-        MyApp.createwalls(self)
-w = MyApp()
-base.run()
\ No newline at end of file
+        self.createwalls()
+        if self.steering_backend == "numpy" and self.flowfield_pathing:
+            # The ground floor grid, baked by freezify.py
+            self.Aiworld.flowfield = FlowField.from_navfloor(load_navgrid(self.level_name)[0])
+        # The game starts once the models are loaded
+        self.loadassets()
+if __name__ == "__main__":
+    w = MyApp()
+    base.run()
\ No newline at end of file
@@ -0,0 +1,215 @@
+import hashlib
+import os
+from collections import OrderedDict
+from panda3d.core import (NodePath, Filename, PandaSystem, Loader, LoaderOptions, OFileStream, DatagramOutputFile,
+                          BamWriter, BamEnums)
+from level import find_file
+
+
+def model_bytes(model):
+    # A rough size of a model in memory: its vertex arrays and texture images
+    total = 0
+    for path in model.findAllMatches("**/+GeomNode"):
+        node = path.node()
+        for i in range(node.getNumGeoms()):
+            vdata = node.getGeom(i).getVertexData()
+            for j in range(vdata.getNumArrays()):
+                total += vdata.getArray(j).getDataSizeBytes()
+    for texture in model.findAllTextures():
+        total += texture.getRamImageSize()
+    return total
+
+
+def load_file(path):
+    # Loads a model from a file, bypassing Panda's model cache, for the
+    # scripts that prepare and convert models (freezify.py, sceneprep.py)
+    node = Loader.getGlobalPtr().loadSync(Filename.fromOsSpecific(path),
+                                          LoaderOptions(LoaderOptions.LF_report_errors | LoaderOptions.LF_no_cache))
+    if not node:
+        raise IOError('Failed to load model: %s' % (path))
+    return NodePath(node)
+
+
+def write_bam(model, path, source=None, texture_mode=BamEnums.BTM_rawdata):
+    # Like NodePath.writeBamFile, but with the textures in the file by
+    # default, so that it doesn't depend on where the source model was.
+    # With BTM_relative, texture paths are made relative to source instead.
+    # Written to a temporary file first, so that a half-written file is
+    # never loaded.
+    temppath = path + ".tmp"
+    filename = Filename.fromOsSpecific(temppath)
+    filename.setBinary()
+    stream = OFileStream()
+    if not filename.openWrite(stream):
+        raise IOError('Failed to open .bam file for writing: %s' % (temppath))
+    dout = DatagramOutputFile()
+    if source is not None:
+        filename = Filename.fromOsSpecific(source)
+    if not dout.open(stream, filename) or not dout.writeHeader("pbj\0\n\r"):
+        raise IOError('Failed to write to .bam file: %s' % (temppath))
+    writer = BamWriter(dout)
+    writer.setRootNode(model.node())
+    writer.init()
+    writer.setFileTextureMode(texture_mode)
+    writer.writeObject(model.node())
+    writer.flush()
+    writer = None
+    dout.close()
+    stream.close()
+    os.replace(temppath, path)
+
+
+class ModelCache:
+    # Sits in front of loader.loadModel, with two tiers:
+    #  - RAM: the loaded models, least recently used first out once they add
+    #    up to more than max_bytes (see model_bytes).
+    #  - disk: every source model converted to .bam in cache_dir, named after
+    #    a hash of the source file and the Panda3D version, so that a changed
+    #    model or a new Panda3D is converted again.  Loading a .bam skips the
+    #    glTF parsing, like the web build does with its converted models.
+    #    cache_dir None turns this tier off; a relative one is taken from
+    #    the current directory.  It also turns itself off if cache_dir can't
+    #    be written to (a read-only install), leaving the RAM tier.
+    # get() returns the cached model itself, which must not be changed:
+    # instance or copy it (see prototypes.PrototypeCache), or use load().
+    # request() is get() with Panda's asynchronous loader.
+    #
+    # prepare maps source paths to a function that every load of that model
+    # goes through (see sceneprep.py); the disk tier keeps the result.  Each
+    # function needs a cache_key attribute: a string of the settings it
+    # applies, which goes into the hash, so that changing them converts the
+    # model again ("" for none).
+    def __init__(self, loader, max_bytes=64 << 20, cache_dir=None, prepare={}):
+        for path, function in prepare.items():
+            if not hasattr(function, "cache_key"):
+                raise ValueError("Model preparation for %s has no cache_key" % path)
+        self._loader = loader
+        self.prepare = prepare
+        self.max_bytes = max_bytes
+        self.cache_dir = None if cache_dir is None else os.path.abspath(cache_dir)
+        self._models = OrderedDict()  # path: (model, bytes)
+        self._keys = {}  # (path, size, mtime): source hash
+        self._pending = {}  # path: callbacks of request()
+        self.bytes = 0
+        self.ram_hits = 0
+        self.ram_misses = 0
+        self.disk_hits = 0
+        self.disk_misses = 0
+        self.evictions = 0
+        if cache_dir is not None:
+            try:
+                os.makedirs(self.cache_dir, exist_ok=True)
+            except OSError as error:
+                self._disk_failed(error)
+
+    def get(self, path):
+        cached = self._models.get(path)
+        if cached is not None:
+            self._models.move_to_end(path)
+            self.ram_hits += 1
+            return cached[0]
+        self.ram_misses += 1
+        filename, bampath = self._source(path)
+        return self._loaded(path, bampath, self._loader.loadModel(filename, noCache=True))
+
+    def request(self, path, callback):
+        # Calls callback(model) with the model get() would give, once it has
+        # been loaded in the background; right away if it is in RAM
+        cached = self._models.get(path)
+        if cached is not None:
+            self._models.move_to_end(path)
+            self.ram_hits += 1
+            callback(cached[0])
+            return
+        if path in self._pending:
+            self._pending[path].append(callback)
+            return
+        self.ram_misses += 1
+        self._pending[path] = [callback]
+        filename, bampath = self._source(path)
+
+        def loaded(model):
+            if model is None:
+                # As loader.loadModel raises when loading synchronously
+                del self._pending[path]
+                raise IOError('Could not load model file(s): %s' % (filename,))
+            model = self._loaded(path, bampath, model)
+            for callback in self._pending.pop(path):
+                callback(model)
+        self._loader.loadModel(filename, noCache=True, callback=loaded)
+
+    def load(self, path):
+        # A copy of the model of its own, like loader.loadModel gives
+        return NodePath(self.get(path).node().copySubgraph())
+
+    def _bampath(self, path, source):
+        # The disk tier file of a source model found at source, or None if
+        # it has none
+        if self.cache_dir is None or source is None or not os.path.isfile(source):
+            return None
+        stat = os.stat(source)
+        key = (source, stat.st_size, stat.st_mtime_ns)
+        digest = self._keys.get(key)
+        if digest is None:
+            sha = hashlib.sha1(PandaSystem.getVersionString().encode())
+            if path in self.prepare:
+                sha.update(self.prepare[path].cache_key.encode())
+            with open(source, "rb") as f:
+                for chunk in iter(lambda: f.read(1 << 20), b""):
+                    sha.update(chunk)
+            digest = self._keys[key] = sha.hexdigest()[:16]
+        name = os.path.splitext(os.path.basename(path))[0]
+        if path in self.prepare:
+            name += "-" + self.prepare[path].__name__
+        return os.path.join(self.cache_dir, "%s-%s.bam" % (name, digest))
+
+    def _source(self, path):
+        # What to load for a model: (filename, .bam to write it to or None).
+        # The source is looked up on the model path, as the loader would,
+        # and both are given to the loader as absolute paths, so that it
+        # loads the same files that are checked here.
+        source = find_file(path)
+        bampath = self._bampath(path, source)
+        if bampath is not None and os.path.exists(bampath):
+            self.disk_hits += 1
+            return Filename.fromOsSpecific(bampath), None
+        if bampath is not None:
+            self.disk_misses += 1
+        if source is None:
+            # Not found: the loader says so
+            return path, None
+        return Filename.fromOsSpecific(source), bampath
+
+    def _loaded(self, path, bampath, model):
+        prepare = self.prepare.get(path)
+        if prepare is not None:
+            model = prepare(model)
+        if bampath is not None and self.cache_dir is not None:
+            try:
+                write_bam(model, bampath)
+            except OSError as error:
+                self._disk_failed(error)
+        size = model_bytes(model)
+        self._models[path] = (model, size)
+        self.bytes += size
+        # Always keep the model just loaded, even if it is bigger than the cache
+        while self.bytes > self.max_bytes and len(self._models) > 1:
+            evicted, (evicted_model, evicted_size) = self._models.popitem(last=False)
+            self.bytes -= evicted_size
+            self.evictions += 1
+        return model
+
+    def _disk_failed(self, error):
+        print("Model cache: no disk tier (%s)" % error)
+        self.cache_dir = None
+
+    def stats(self):
+        return {
+            "ram_hits": self.ram_hits,
+            "ram_misses": self.ram_misses,
+            "disk_hits": self.disk_hits,
+            "disk_misses": self.disk_misses,
+            "evictions": self.evictions,
+            "ram_models": len(self._models),
+            "ram_bytes": self.bytes,
+        }
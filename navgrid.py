@@ -0,0 +1,102 @@
+import json
+import struct
+from level import build_level, find_file, is_stale
+from collisionoptimizer import optimize_level
+from flowfield import FlowField
+
+try:
+    # Not in the WebAssembly build, where the file is read into memory
+    import mmap
+except ImportError:
+    mmap = None
+
+# A .nav file holds the occupancy grid of every floor of a level, as baked
+# from its walls by FlowField (one byte per cell, nonzero where the walls
+# are):
+#   header                 "NAVG", version, number of floors
+#   floor header per floor height, x0, y0, cell size, width, depth, offset
+#   grids                  width * depth bytes per floor, at offset
+# All little-endian.  Loading maps the file and hands out memoryviews into
+# it, so no grid is copied or computed at startup.
+MAGIC = b"NAVG"
+VERSION = 1
+HEADER = struct.Struct("<4sHH")
+FLOOR = struct.Struct("<ffffIII")
+
+
+class NavFloor:
+    # The grid of one floor: blocked[j * width + i] is the cell with its
+    # corner at (x0 + i * cell_size, y0 + j * cell_size)
+    def __init__(self, height, x0, y0, cell_size, width, depth, blocked):
+        self.height = height
+        self.x0 = x0
+        self.y0 = y0
+        self.cell_size = cell_size
+        self.width = width
+        self.depth = depth
+        self.blocked = blocked
+
+
+def bake_navgrid(wall_node, heights, cell_size=1.0, margin=1.0):
+    # The .nav file contents for the walls of a level, one floor per height
+    fields = [FlowField.from_collision_node(wall_node, height, cell_size, margin) for height in heights]
+    offset = HEADER.size + FLOOR.size * len(fields)
+    data = bytearray(HEADER.pack(MAGIC, VERSION, len(fields)))
+    for field in fields:
+        data += FLOOR.pack(field.height, field.x0, field.y0, field.cell_size, field.width, field.depth, offset)
+        offset += len(field.blocked)
+    for field in fields:
+        data += field.blocked
+    return bytes(data)
+
+
+def read_navgrid(buffer):
+    # [NavFloor] of the .nav file contents in buffer, without copying them
+    view = memoryview(buffer)
+    magic, version, count = HEADER.unpack_from(view)
+    if magic != MAGIC or version != VERSION:
+        raise IOError("Not a version %d navigation grid" % VERSION)
+    floors = []
+    for i in range(count):
+        height, x0, y0, cell_size, width, depth, offset = FLOOR.unpack_from(view, HEADER.size + FLOOR.size * i)
+        floors.append(NavFloor(height, x0, y0, cell_size, width, depth, view[offset:offset + width * depth]))
+    return floors
+
+
+def _bake_level(srcpath):
+    with open(srcpath) as f:
+        data = json.load(f)
+    # The same walls as load_level gives
+    level = build_level(optimize_level(data)[0])
+    return bake_navgrid(level.find("wall").node(), data["floors"])
+
+
+def compile_navgrid(srcpath, dstpath):
+    # Bakes the floors of a level description to a .nav file
+    data = _bake_level(srcpath)
+    with open(dstpath, "wb") as f:
+        f.write(data)
+    print(srcpath + ":", "%d floors, %d bytes" % (len(read_navgrid(data)), len(data)))
+
+
+def load_navgrid(name):
+    # The floors of levels/<name>.nav as baked by freezify.py, or baked now
+    # from levels/<name>.json when there is no .nav or the .json is newer
+    # (both looked up like load_level does)
+    srcpath = find_file("levels/%s.json" % name)
+    navpath = find_file("levels/%s.nav" % name)
+    if is_stale(srcpath, navpath):
+        if srcpath is None:
+            raise IOError("No level %s" % name)
+        return read_navgrid(_bake_level(srcpath))
+    with open(navpath, "rb") as f:
+        if mmap is not None:
+            return read_navgrid(mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ))
+        return read_navgrid(f.read())
+
+
+if __name__ == "__main__":
+    # python navgrid.py levels/mansion.json ... bakes the given levels
+    import sys
+    for srcpath in sys.argv[1:]:
+        compile_navgrid(srcpath, srcpath[:-5] + ".nav")
@@ -0,0 +1,38 @@
+class NPCPool:
+    # Dead ghosts are parked here instead of being destroyed.  A parked ghost
+    # keeps its (stashed) nodes, its CollisionNode and its AICharacter, which
+    # stays in the AIWorld with its behaviors removed, so that a later wave
+    # can bring it back without loading models or creating new objects.
+    #
+    # A ghost is stored as the (node, aidot, aichar, behaviors, collider)
+    # tuple that NPCRegistry.add() takes.
+    def __init__(self):
+        self._parked = []
+        self.created = 0
+        self.reused = 0
+
+    def __len__(self):
+        return len(self._parked)
+
+    def new_name(self):
+        # AICharacters are never removed from the AIWorld, so every ghost that
+        # is ever created needs a name of its own.
+        name = f"npc{self.created}"
+        self.created += 1
+        return name
+
+    def acquire(self):
+        if not self._parked:
+            return None
+        self.reused += 1
+        return self._parked.pop()
+
+    def release(self, ghost):
+        self._parked.append(ghost)
+
+    def stats(self):
+        return {
+            "created": self.created,
+            "reused": self.reused,
+            "parked": len(self._parked),
+        }
@@ -0,0 +1,67 @@
+from math import cos, radians
+
+try:
+    # Not in the WebAssembly build; the plain loops below are used there
+    import numpy as np
+except ImportError:
+    np = None
+
+# Queries over every live ghost of an NPCRegistry at once, in one pass over
+# its position array.  With numpy they work on views of the registry arrays
+# (numpy.frombuffer), which must not outlive the call, or the arrays can't
+# grow.  Ids are returned in ascending order.
+
+
+def _views(registry):
+    positions = np.frombuffer(registry.positions, dtype=np.float32).reshape(-1, 3)
+    alive = np.frombuffer(registry.alive, dtype=np.int8) != 0
+    return positions, alive
+
+
+def ids_within(registry, x, y, z, radius):
+    # The ghosts within radius of (x, y, z)
+    radius2 = radius * radius
+    if np is not None:
+        positions, alive = _views(registry)
+        offsets = positions - np.array((x, y, z), dtype=np.float32)
+        inside = np.einsum('ij,ij->i', offsets, offsets) <= radius2
+        return np.flatnonzero(inside & alive).tolist()
+    positions = registry.positions
+    ids = []
+    for npc_id, alive in enumerate(registry.alive):
+        if alive:
+            i = npc_id * 3
+            dx = positions[i] - x
+            dy = positions[i + 1] - y
+            dz = positions[i + 2] - z
+            if dx * dx + dy * dy + dz * dz <= radius2:
+                ids.append(npc_id)
+    return ids
+
+
+def ids_in_cone(registry, x, y, z, direction, angle, distance):
+    # The ghosts within distance of (x, y, z) and at most angle degrees off
+    # direction (a unit vector) as seen from there
+    distance2 = distance * distance
+    cos2 = cos(radians(angle)) ** 2
+    dir_x, dir_y, dir_z = direction
+    if np is not None:
+        positions, alive = _views(registry)
+        offsets = positions - np.array((x, y, z), dtype=np.float32)
+        lengths2 = np.einsum('ij,ij->i', offsets, offsets)
+        along = offsets @ np.array(direction, dtype=np.float32)
+        inside = (lengths2 <= distance2) & (along > 0) & (along * along >= cos2 * lengths2)
+        return np.flatnonzero(inside & alive).tolist()
+    positions = registry.positions
+    ids = []
+    for npc_id, alive in enumerate(registry.alive):
+        if alive:
+            i = npc_id * 3
+            dx = positions[i] - x
+            dy = positions[i + 1] - y
+            dz = positions[i + 2] - z
+            length2 = dx * dx + dy * dy + dz * dz
+            along = dx * dir_x + dy * dir_y + dz * dir_z
+            if length2 <= distance2 and along > 0 and along * along >= cos2 * length2:
+                ids.append(npc_id)
+    return ids
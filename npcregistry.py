@@ -0,0 +1,161 @@
+from array import array
+
+
+class NPCRegistry:
+    # Holds the state of every ghost under a small integer id.  Numeric state
+    # lives in flat typed arrays (three floats per position), so per-frame
+    # passes walk contiguous memory instead of hashing names; numpy can wrap
+    # them with numpy.frombuffer without a copy where it is available.
+    # Scene graph objects are kept in plain lists indexed by the same id, and
+    # ids_by_collider maps each collision node back to its ghost.
+    #
+    # previous holds the positions as they were at the start of the last
+    # simulation tick, so that the ghosts can be drawn in between (see
+    # interpolate()).
+    def __init__(self, capacity=16):
+        self.capacity = 0
+        self.positions = array('f')
+        self.previous = array('f')
+        self.headings = array('f')
+        self.healths = array('f')
+        self.alive = array('b')
+        self.nodes = []
+        self.aidots = []
+        self.aichars = []
+        self.behaviors = []
+        self.colliders = []
+        self.ids_by_collider = {}
+        self._free = []
+        self._count = 0
+        self._grow(capacity)
+
+    def __len__(self):
+        return self._count
+
+    def _grow(self, capacity):
+        extra = capacity - self.capacity
+        if extra <= 0:
+            return
+        self.positions.extend([0.0] * (extra * 3))
+        self.previous.extend([0.0] * (extra * 3))
+        self.headings.extend([0.0] * extra)
+        self.healths.extend([0.0] * extra)
+        self.alive.extend([0] * extra)
+        for objects in (self.nodes, self.aidots, self.aichars, self.behaviors, self.colliders):
+            objects.extend([None] * extra)
+        # Hand out the lowest ids first.
+        self._free.extend(range(capacity - 1, self.capacity - 1, -1))
+        self.capacity = capacity
+
+    def next_id(self):
+        # The id that the next add() call will return.
+        if not self._free:
+            self._grow(self.capacity * 2)
+        return self._free[-1]
+
+    def add(self, node, aidot, aichar, behaviors, collider, health):
+        npc_id = self.next_id()
+        self._free.pop()
+        self.nodes[npc_id] = node
+        self.aidots[npc_id] = aidot
+        self.aichars[npc_id] = aichar
+        self.behaviors[npc_id] = behaviors
+        self.colliders[npc_id] = collider
+        self.ids_by_collider[collider.node()] = npc_id
+        self.healths[npc_id] = health
+        self.alive[npc_id] = 1
+        pos = node.getPos()
+        self.set_transform(npc_id, pos[0], pos[1], pos[2], node.getH())
+        # Not drawn sliding in from where the id was last used
+        i = npc_id * 3
+        self.previous[i:i + 3] = self.positions[i:i + 3]
+        self._count += 1
+        return npc_id
+
+    def remove(self, npc_id):
+        if not self.alive[npc_id]:
+            return
+        self.alive[npc_id] = 0
+        self.healths[npc_id] = 0
+        self.nodes[npc_id] = None
+        self.aidots[npc_id] = None
+        self.aichars[npc_id] = None
+        self.behaviors[npc_id] = None
+        del self.ids_by_collider[self.colliders[npc_id].node()]
+        self.colliders[npc_id] = None
+        self._free.append(npc_id)
+        self._count -= 1
+
+    def alive_ids(self):
+        return [npc_id for npc_id, alive in enumerate(self.alive) if alive]
+
+    def dead_ids(self):
+        # Ghosts that are still registered but have run out of health.
+        healths = self.healths
+        return [npc_id for npc_id, alive in enumerate(self.alive) if alive and healths[npc_id] <= 0]
+
+    def find(self, collision_node):
+        # The id of the ghost a collision node belongs to, or None.
+        return self.ids_by_collider.get(collision_node)
+
+    def damage(self, npc_id, amount):
+        if self.alive[npc_id]:
+            self.healths[npc_id] -= amount
+
+    def get_pos(self, npc_id):
+        i = npc_id * 3
+        return self.positions[i:i + 3]
+
+    def set_transform(self, npc_id, x, y, z, h):
+        i = npc_id * 3
+        positions = self.positions
+        positions[i] = x
+        positions[i + 1] = y
+        positions[i + 2] = z
+        self.headings[npc_id] = h
+
+    def offset(self, npc_id, dx, dy, dz):
+        i = npc_id * 3
+        positions = self.positions
+        positions[i] += dx
+        positions[i + 1] += dy
+        positions[i + 2] += dz
+
+    def pull_from_aidots(self, npc_ids, height):
+        # The AI moves the invisible aidot proxies; the ghosts follow them at
+        # a fixed height.
+        for npc_id in npc_ids:
+            aidot = self.aidots[npc_id]
+            aidot.setZ(height)
+            pos = aidot.getPos()
+            self.set_transform(npc_id, pos[0], pos[1], height, aidot.getH())
+
+    def push_to_nodes(self, npc_ids):
+        positions = self.positions
+        headings = self.headings
+        nodes = self.nodes
+        for npc_id in npc_ids:
+            i = npc_id * 3
+            node = nodes[npc_id]
+            node.setPos(positions[i], positions[i + 1], positions[i + 2])
+            node.setH(headings[npc_id])
+
+    def save_previous(self):
+        # Call at the start of every simulation tick
+        self.previous[:] = self.positions
+
+    def interpolate(self, npc_ids, alpha):
+        # Like push_to_nodes, but shows each ghost alpha of the way from where
+        # it was at the start of the last tick to where it is now
+        positions = self.positions
+        previous = self.previous
+        headings = self.headings
+        nodes = self.nodes
+        for npc_id in npc_ids:
+            i = npc_id * 3
+            x = previous[i]
+            y = previous[i + 1]
+            z = previous[i + 2]
+            node = nodes[npc_id]
+            node.setPos(x + (positions[i] - x) * alpha, y + (positions[i + 1] - y) * alpha, z + (positions[i + 2] - z) * alpha)
+            node.setH(headings[npc_id])
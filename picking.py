@@ -0,0 +1,75 @@
+from panda3d.core import CollisionTraverser, CollisionHandlerQueue, CollisionNode, CollisionRay, BitMask32
+
+
+class Picker:
+    # Rays that are made once and kept on their parent (the camera), with a
+    # traverser of their own.  A pick only tests the rays against the subtree
+    # it is given, so it neither allocates nodes nor re-runs the camera pusher
+    # of the main traverser.
+    #
+    # By default there is one ray, straight ahead.  With more directions
+    # (relative to the parent), every ray is a collider of the same traverser,
+    # so that all of them are resolved by one traversal.
+    def __init__(self, parent, mask=BitMask32.bit(0), name='wand-ray', directions=((0, 1, 0),)):
+        self.queue = CollisionHandlerQueue()
+        self.traverser = CollisionTraverser(name)
+        self.nodes = []
+        self.paths = []
+        for direction in directions:
+            node = CollisionNode(name)
+            node.addSolid(CollisionRay(0, 0, 0, *direction))
+            node.setFromCollideMask(mask)
+            node.setIntoCollideMask(BitMask32.allOff())
+            path = parent.attachNewNode(node)
+            self.traverser.addCollider(path, self.queue)
+            self.nodes.append(node)
+            self.paths.append(path)
+        self.node = self.nodes[0]
+        self.path = self.paths[0]
+
+    def nearest(self, root):
+        # The closest entry under root and its distance, or (None, None)
+        self.queue.clearEntries()
+        self.traverser.traverse(root)
+        if not self.queue.getNumEntries():
+            return None, None
+        self.queue.sortEntries()
+        entry = self.queue.getEntry(0)
+        return entry, entry.getSurfacePoint(self.path).length()
+
+    def nearest_by_ray(self, root):
+        # {ray node: (closest entry, distance)} for every ray that hit
+        # something under root
+        self.queue.clearEntries()
+        self.traverser.traverse(root)
+        self.queue.sortEntries()
+        nearest = {}
+        for i in range(self.queue.getNumEntries()):
+            entry = self.queue.getEntry(i)
+            node = entry.getFromNode()
+            if node not in nearest:
+                nearest[node] = (entry, entry.getSurfacePoint(entry.getFromNodePath()).length())
+        return nearest
+
+    def pick(self, targets, blocker=None):
+        # The closest entry under targets, unless something under blocker
+        # (the walls) is in the way
+        entry, distance = self.nearest(targets)
+        if entry is not None and blocker is not None:
+            wall, wall_distance = self.nearest(blocker)
+            if wall is not None and wall_distance < distance:
+                return None
+        return entry
+
+    def pick_each(self, targets, blocker=None):
+        # pick() for every ray at once: the closest entry under targets of
+        # each ray that isn't blocked, in the order of the directions
+        hits = self.nearest_by_ray(targets)
+        walls = self.nearest_by_ray(blocker) if hits and blocker is not None else {}
+        entries = []
+        for node in self.nodes:
+            if node in hits:
+                entry, distance = hits[node]
+                if node not in walls or walls[node][1] >= distance:
+                    entries.append(entry)
+        return entries
@@ -0,0 +1,133 @@
+from array import array
+from panda3d.core import Texture, Shader, SamplerState, OmniBoundingVolume
+
+
+class PrototypeCache:
+    # Keeps every model it is asked for, loaded through a
+    # modelcache.ModelCache.  Spawned objects get an instance (shared
+    # geometry, no reload).
+    def __init__(self, models):
+        self._models = models
+        self._prototypes = {}
+        self.loads = 0
+
+    def get(self, path):
+        prototype = self._prototypes.get(path)
+        if prototype is None:
+            prototype = self._models.get(path)
+            self._prototypes[path] = prototype
+            self.loads += 1
+        return prototype
+
+    def add(self, path, prototype):
+        # Keeps a model that was loaded some other way as the one for path
+        self._prototypes[path] = prototype
+        self.loads += 1
+
+    def instance(self, path, parent):
+        return self.get(path).instanceTo(parent)
+
+
+INSTANCE_VERTEX_SHADER = """#version 330
+
+uniform mat4 p3d_ModelViewProjectionMatrix;
+uniform sampler2D instance_data;
+
+in vec4 p3d_Vertex;
+in vec3 p3d_Normal;
+in vec2 p3d_MultiTexCoord0;
+
+out vec2 texcoord;
+out vec3 normal;
+
+void main() {
+    // One texel per ghost: x, y, z and heading in degrees.
+    vec4 data = texelFetch(instance_data, ivec2(gl_InstanceID, 0), 0);
+    float h = radians(data.w);
+    mat3 heading = mat3(cos(h), sin(h), 0,
+                        -sin(h), cos(h), 0,
+                        0, 0, 1);
+    vec3 pos = heading * p3d_Vertex.xyz + data.xyz;
+    gl_Position = p3d_ModelViewProjectionMatrix * vec4(pos, 1);
+    normal = heading * p3d_Normal;
+    texcoord = p3d_MultiTexCoord0;
+}
+"""
+
+INSTANCE_FRAGMENT_SHADER = """#version 330
+
+uniform sampler2D p3d_Texture0;
+uniform vec4 p3d_ColorScale;
+
+in vec2 texcoord;
+in vec3 normal;
+
+out vec4 p3d_FragColor;
+
+void main() {
+    float light = 0.6 + 0.4 * max(dot(normalize(normal), vec3(0, 0, 1)), 0);
+    vec4 color = texture(p3d_Texture0, texcoord) * p3d_ColorScale;
+    p3d_FragColor = vec4(color.rgb * light, color.a);
+}
+"""
+
+
+class GhostInstancer:
+    # Draws every ghost with one instanced draw call.  The model is flattened
+    # once with its fixed pitch and scale baked in; per-ghost position and
+    # heading are uploaded each frame into a float texture read by the
+    # vertex shader.  The ghost nodes themselves then carry no geometry.
+    def __init__(self, prototype, parent, hpr=(0, 90, 0), scale=2, capacity=64):
+        self.model = prototype.copyTo(parent)
+        self.model.setHpr(*hpr)
+        self.model.setScale(scale)
+        self.model.flattenStrong()
+        # The instances are spread out over the whole level, so the bounds of
+        # the single model say nothing about what is visible.
+        self.model.node().setBounds(OmniBoundingVolume())
+        self.model.node().setFinal(True)
+        self.model.setShader(Shader.make(Shader.SL_GLSL, INSTANCE_VERTEX_SHADER, INSTANCE_FRAGMENT_SHADER))
+
+        self.texture = Texture("ghost-instances")
+        self.texture.setMinfilter(SamplerState.FT_nearest)
+        self.texture.setMagfilter(SamplerState.FT_nearest)
+        self.capacity = 0
+        self._data = array('f')
+        self._resize(capacity)
+        self.model.setShaderInput("instance_data", self.texture)
+        self.model.setInstanceCount(0)
+        self.model.hide()
+
+    def _resize(self, capacity):
+        self.capacity = capacity
+        self.texture.setup2dTexture(capacity, 1, Texture.T_float, Texture.F_rgba32)
+        self._data = array('f', bytes(capacity * 16))
+
+    def update(self, registry, npc_ids, alpha=1.0):
+        # Shows the ghosts alpha of the way between the last two ticks, like
+        # NPCRegistry.interpolate
+        count = len(npc_ids)
+        if count > self.capacity:
+            self._resize(max(count, self.capacity * 2))
+
+        data = self._data
+        positions = registry.positions
+        previous = registry.previous
+        headings = registry.headings
+        for slot, npc_id in enumerate(npc_ids):
+            i = npc_id * 3
+            j = slot * 4
+            x = previous[i]
+            y = previous[i + 1]
+            z = previous[i + 2]
+            data[j] = x + (positions[i] - x) * alpha
+            data[j + 1] = y + (positions[i + 1] - y) * alpha
+            data[j + 2] = z + (positions[i + 2] - z) * alpha
+            data[j + 3] = headings[npc_id]
+
+        self.texture.setRamImage(data.tobytes())
+        self.model.setInstanceCount(count)
+        if count:
+            self.model.show()
+        else:
+            self.model.hide()
@@ -0,0 +1,29 @@
+from direct.showbase.MessengerGlobal import messenger
+from npcqueries import ids_within
+
+
+class ProximityDamage:
+    # Hurts the player for every ghost within radius of them, at rate health
+    # per second per ghost.  Call update() once per fixed tick: it measures
+    # every ghost in one query over the registry (see npcqueries.py) and
+    # sends a single event with the totals of the tick, instead of one
+    # collision event per touching ghost.
+    def __init__(self, registry, radius, rate, event='player-hit'):
+        self.registry = registry
+        self.radius = radius
+        self.rate = rate
+        self.event = event
+
+    def count(self, x, y, z):
+        # The number of live ghosts within radius of (x, y, z)
+        return len(ids_within(self.registry, x, y, z, self.radius))
+
+    def update(self, x, y, z, dt):
+        # Sends event with (hits, damage) if any ghost is close enough, and
+        # returns the damage
+        hits = self.count(x, y, z)
+        if not hits:
+            return 0
+        damage = hits * self.rate * dt
+        messenger.send(self.event, [hits, damage])
+        return damage
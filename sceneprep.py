@@ -0,0 +1,79 @@
+from panda3d.core import NodePath
+
+# Preparing a static model bakes its placement into the vertices and
+# flattens it: the glTF node hierarchy is collapsed and all geometry with the
+# same material and textures is merged, so that it is culled and drawn as a
+# few big Geoms instead of one per glTF mesh.  The result is tagged, so that
+# preparing it again (after loading it from a prepared .bam) does nothing.
+PREPARED_TAG = "static-prepared"
+
+
+def scene_stats(model):
+    # Node count, and the GeomNodes and Geoms (about one draw call each) and
+    # distinct render states under model
+    geom_nodes = model.findAllMatches("**/+GeomNode")
+    geoms = 0
+    states = set()
+    for path in geom_nodes:
+        node = path.node()
+        net_state = path.getNetState()
+        for i in range(node.getNumGeoms()):
+            geoms += 1
+            states.add(net_state.compose(node.getGeomState(i)))
+    return {
+        "nodes": model.findAllMatches("**").getNumPaths(),
+        "geom_nodes": geom_nodes.getNumPaths(),
+        "geoms": geoms,
+        "states": len(states),
+    }
+
+
+def describe(before, after):
+    return ", ".join("%s %d -> %d" % (key, before[key], after[key]) for key in before)
+
+
+def prepare_static(model, hpr=(0, 0, 0), scale=1):
+    # Returns the prepared model: model as it would look under a node with
+    # the given hpr and scale, but with an identity transform
+    if model.hasTag(PREPARED_TAG):
+        return model
+    root = NodePath(model.getName())
+    model.reparentTo(root)
+    model.setHpr(*hpr)
+    model.setScale(scale)
+    # ModelNodes (one per glTF node) keep flattenStrong from merging anything
+    root.clearModelNodes()
+    root.flattenStrong()
+    root.setTag(PREPARED_TAG, "1")
+    return root
+
+
+MANSION_HPR = (90, 90, 90)
+MANSION_SCALE = 1
+
+
+def prepare_mansion(model):
+    return prepare_static(model, hpr=MANSION_HPR, scale=MANSION_SCALE)
+
+
+# Changing the placement must not load a stale mansion from the model cache
+prepare_mansion.cache_key = repr((MANSION_HPR, MANSION_SCALE))
+
+
+# What to prepare each static model with, both when it is loaded (see
+# modelcache.ModelCache) and when freezify.py converts it
+STATIC_MODELS = {
+    "models/HauntedMansion.glb": prepare_mansion,
+}
+
+
+if __name__ == "__main__":
+    # python sceneprep.py models/HauntedMansion.glb ... reports what
+    # preparing the given models does
+    import sys
+    from modelcache import load_file
+    for path in sys.argv[1:]:
+        model = load_file(path)
+        before = scene_stats(model)
+        prepare = STATIC_MODELS.get(path, prepare_static)
+        print(path + ":", describe(before, scene_stats(prepare(model))))
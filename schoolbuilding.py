@@ -2,13 +2,20 @@ from direct.showbase.ShowBase import ShowBase
 from direct.task import Task
 from direct.showbase.DirectObject import DirectObject
 from direct.controls.InputState import InputState
-from panda3d.core import CollisionTraverser, CollisionRay, BitMask32, CollisionHandlerQueue, CollisionHandlerEvent, CollisionNode, CollisionHandlerPusher, CollisionBox, Point3, CollisionSphere, LVector3, CollisionPolygon, WindowProperties
+from panda3d.core import CollisionTraverser, CollisionRay, BitMask32, CollisionHandlerQueue, CollisionHandlerEvent, CollisionNode, CollisionHandlerPusher, CollisionSphere, LVector3, WindowProperties
 from panda3d.ai import AIWorld, AICharacter
 import direct.gui.DirectGuiGlobals as DGG
+import sys
+import os
 from direct.actor.Actor import Actor
 from direct.gui.DirectGui import *
 from direct.gui.OnscreenImage import OnscreenImage
 from direct.showbase.Transitions import Transitions
+from spatialgrid import SpatialGrid, separation_offsets
+from level import load_level, spawn_triggers
+from triggers import TriggerVolumes
+from lod import LOD_MODELS
+from modelcache import ModelCache
 class CameraControllerBehaviour(DirectObject):
     _instances = 0
     def __init__(self, camera, velocity=9, mouse_sensitivity=0.2, initial_pos=(-0.5, -12, 7.7), showbase=None):
@@ -136,6 +143,11 @@ class CameraControllerBehaviour(DirectObject):
         return Task.cont
         
 class MyApp(ShowBase):
+    separation_threshold = 3  # Minimum distance between NPCs
+    repelling_force = 1  # Strength of the repelling force
+    door_ghosts = 5  # Ghosts brought in at each door
+    model_cache_bytes = 64 << 20  # Loaded models kept in memory, least recently used first out
+    model_cache_dir = None if sys.platform == "emscripten" else os.path.join(os.path.dirname(os.path.abspath(__file__)), "cache", "models")  # Models converted to .bam (None: off), shared with main.py
     def manaupdate(self, task):
         self.manaamount = self.manaamount + .02
         self.manabar['value'] = self.manaamount
@@ -164,36 +176,6 @@ class MyApp(ShowBase):
                 self.camera.setPos(0, -18, 14)
             respawnbutton = DirectButton(text=("respawn", "fine", "do you really?", "disabled"),
                  scale=.1, command=reset, pos = (0, -10, -.8))
-    def spawnatdoor1(self, task):
-        if (round(self.camera.getX()) == -1) and (round(self.camera.getY()) == -34):
-            self.spawnnpcs(5, -.8, -34)
-            return Task.done
-        return Task.cont
-    def spawnatdoor2(self, task):
-        if (round(self.camera.getX()) == 14) and (round(self.camera.getY()) == -49):
-            self.spawnnpcs(5, 14, -49)
-            return Task.done
-        return Task.cont
-    def spawnatdoor3(self, task):
-        if (round(self.camera.getX()) == -15) and (round(self.camera.getY()) == -20):
-            self.spawnnpcs(5, -15, -21)
-            return Task.done
-        return Task.cont
-    def spawnatdoor4(self, task):
-        if (round(self.camera.getX()) == -21) and (round(self.camera.getY()) == -16):
-            self.spawnnpcs(5, -21, -16)
-            return Task.done
-        return Task.cont
-    def spawnatdoor5(self, task):
-        if (round(self.camera.getX()) == -33) and (round(self.camera.getY()) == -49):
-            self.spawnnpcs(5, -33, -49)
-            return Task.done
-        return Task.cont
-    def spawnatdoor6(self, task):
-        if (round(self.camera.getX()) == 32) and (round(self.camera.getY()) == -25):
-            self.spawnnpcs(5, 32, -25)
-            return Task.done
-        return Task.cont
     def click(self):
         # Create a CollisionRay for the wand
         ray_node = CollisionNode('wand-ray')
@@ -310,7 +292,10 @@ class MyApp(ShowBase):
         self.wand = self.loader.loadModel("models/basic_wand.glb")
         self.wand.reparentTo(self.render)
         self.wand.setScale(.1, .1, .1)
-        self.miniboss = self.loader.loadModel(r'models/monster_with_glowing_eyes.glb')
+        # Drawn with less detail from afar, see lod.py; the cache keeps the
+        # levels on disk so that they are only made once
+        self.models = ModelCache(self.loader, self.model_cache_bytes, self.model_cache_dir, LOD_MODELS)
+        self.miniboss = self.models.load(r'models/monster_with_glowing_eyes.glb')
         self.miniboss.setScale(15,15,15)
         self.miniboss.setHpr(0,90,0)
         self.miniboss.setPos(0, 10, 10)
@@ -337,112 +322,22 @@ class MyApp(ShowBase):
         self.healthpoints-=1
         print(self.healthpoints)
     def createwalls(self):
-        self.wall_collision_node = CollisionNode('wall')
-        self.wall_collision_node.addSolid(CollisionBox(Point3(22, -6.5, 32), 19, .5, 27))
-        self.wall_collision_node.addSolid(CollisionBox(Point3(-23.5, -6.5, 32), 19, .5, 27))
-        self.wall_collision_node.addSolid(CollisionBox(Point3(0, -6.5, 35), 10, .5, 25))
-        self.wall_collision_node.addSolid(CollisionBox(Point3(0, -63, 30), 48, .5, 27))
-        self.wall_collision_node.addSolid(CollisionBox(Point3(41, -35, 32), .5, 28, 27))
-        self.wall_collision_node.addSolid(CollisionBox(Point3(-43, -35, 32), .5, 28, 27))
-        self.wall_collision_node.addSolid(CollisionBox(Point3(0, -35, 2), 43, 28, 4.5))
-        self.wall_collision_node.addSolid(CollisionBox(Point3(0, 0, 0), 15, 7, 2))
-        self.wall_collision_node.addSolid(CollisionBox(Point3(14, -32, 9), .3, 15, 4))
-        self.wall_collision_node.addSolid(CollisionBox(Point3(-17.5, -15, 9), 1.5, .3, 4))
-        self.wall_collision_node.addSolid(CollisionBox(Point3(-25, -15, 9), 1.7, .3, 4))
-        self.wall_collision_node.addSolid(CollisionBox(Point3(-15.75, -12.5, 9), .3, 6, 4))
-        self.wall_collision_node.addSolid(CollisionBox(Point3(-15.75, -34, 9), .3, 11.5, 4))
-        self.wall_collision_node.addSolid(CollisionBox(Point3(-15.75, -57.5, 9), .3, 5, 4))
-        self.wall_collision_node.addSolid(CollisionBox(Point3(14, -56.5, 9), .3, 6, 4))
-        self.wall_collision_node.addSolid(CollisionBox(Point3(13, -35, 9), 10, .3, 4))
-        self.wall_collision_node.addSolid(CollisionBox(Point3(-23, -35, 9), 19, .3, 4))
-        self.wall_collision_node.addSolid(CollisionBox(Point3(-25, -10, 9), .3, 5, 4))
-        self.wall_collision_node.addSolid(CollisionBox(Point3(-33,-41, 9), .3, 5.5, 4))
-        self.wall_collision_node.addSolid(CollisionBox(Point3(-33,-52.5, 9), .3, 2, 4))
-        self.wall_collision_node.addSolid(CollisionBox(Point3(-38,-55, 9), 5, .3, 4))
-        self.wall_collision_node.addSolid(CollisionBox(Point3(23, -20.5, 9), .3, 14.5, 4))
-        self.wall_collision_node.addSolid(CollisionBox(Point3(27, -25, 9), 3.5, .3, 4))
-        self.wall_collision_node.addSolid(CollisionBox(Point3(37.5, -25, 9), 3.5, .3, 4))
-        self.wall_collision_node.addSolid(CollisionBox(Point3(-13, -9, 7), 1, 1, 1))
-        self.wall_collision_node.addSolid(CollisionBox(Point3(8.5, -33, 6), 4.5, 1, .75))
-        self.wall_collision_node.addSolid(CollisionBox(Point3(-10, -33, 6), 4.5, 1, .75))
-        self.wall_collision_node.addSolid(CollisionBox(Point3(-17.5, -30, 6), 1, 4, 4))
-        self.wall_collision_node.addSolid(CollisionBox(Point3(-36, -34.25, 6), 6, 3.25, .75))
-        self.wall_collision_node.addSolid(CollisionBox(Point3(-38.75, -25.5 , 6), 4, 1.25, .75))
-        self.wall_collision_node.addSolid(CollisionBox(Point3(-40, -12 , 6), 2, 4, .75))
-        self.wall_collision_node.addSolid(CollisionBox(Point3(-28, -11 , 6), 1, 1, 1))
-        self.wall_collision_node.addSolid(CollisionBox(Point3(-18, -11 , 6), 1, 1, 1))
-        self.wall_collision_node.addSolid(CollisionBox(Point3(-34.5, -41.4 , 6), 1, 3.6, .75))
-        self.wall_collision_node.addSolid(CollisionBox(Point3(-42, -54 , 6), 1.5, 1.5, 1))
-        self.wall_collision_node.addSolid(CollisionBox(Point3(-25.75, -40, 6), .75, .5, .75))
-        self.wall_collision_node.addSolid(CollisionBox(Point3(-22.5, -40, 6), .75, .5, .75))
-        self.wall_collision_node.addSolid(CollisionBox(Point3(-25.75, -46, 6), .75, .5, .75))
-        self.wall_collision_node.addSolid(CollisionBox(Point3(-22.5, -46, 6), .75, .5, .75))
-        self.wall_collision_node.addSolid(CollisionBox(Point3(-24.25, -42.75, 6), 3.5, 1.5, .75))
-        self.wall_collision_node.addSolid(CollisionBox(Point3(-18, -58, 6), 1, 5, .75))
-        self.wall_collision_node.addSolid(CollisionBox(Point3(-42, -59, 6), 1, 3, .75))
-        self.wall_collision_node.addSolid(CollisionBox(Point3(-11, -37, 6), 5, 1, .75))
-        self.wall_collision_node.addSolid(CollisionBox(Point3(12, -37, 6), 1, 1.5, .75))
-        self.wall_collision_node.addSolid(CollisionBox(Point3(11.25, -61.5, 6), 3.25, 1.5, .75))
-        self.wall_collision_node.addSolid(CollisionBox(Point3(-13.5, -61, 6), 1, 1.5, .75))
-        self.wall_collision_node.addSolid(CollisionBox(Point3(-1, -55, 6), 4.75, 2, .75))
-        self.wall_collision_node.addSolid(CollisionBox(Point3(6, -49, 6), 2, 1.5, .75))
-        self.wall_collision_node.addSolid(CollisionBox(Point3(-7, -49, 6), 2, 1.5, .75))
-        self.wall_collision_node.addSolid(CollisionBox(Point3(-.8, -49.25, 6), 2, 1.5, .75))
-        self.wall_collision_node.addSolid(CollisionBox(Point3(-.75, -43, 6), 4.5, 1.75, .75))
-        self.wall_collision_node.addSolid(CollisionBox(Point3(15.8, -59.5, 6), .8, 2.95, .75))
-        self.wall_collision_node.addSolid(CollisionBox(Point3(23, -58.7, 6), 2.3, 4, .75))
-        self.wall_collision_node.addSolid(CollisionBox(Point3(39, -58.5, 6), 1.6, 4.2, .75))
-        self.wall_collision_node.addSolid(CollisionBox(Point3(39, -40.4, 6), 1.6, 13.155, .75))
-        self.wall_collision_node.addSolid(CollisionBox(Point3(17.75, -36, 6), 2.95, 1.5, .75))
-        self.wall_collision_node.addSolid(CollisionBox(Point3(25, -29.5, 6), 1.3, 2.95, .75))
-        self.wall_collision_node.addSolid(CollisionBox(Point3(24.5, -21, 6), .7, 1, .75))
-        self.wall_collision_node.addSolid(CollisionBox(Point3(26.1, -12.75, 6), 2.8, 1.4, .75))
-        self.wall_collision_node.addSolid(CollisionBox(Point3(24.5, -21, 6), .7, 1, .75))
-        self.wall_collision_node.addSolid(CollisionBox(Point3(39.5, -10, 6), 1, 1, .75))
-        self.wall_collision_node.addSolid(CollisionBox(Point3(39.5, -20.4, 6), 1, 2.5, .75))
-        self.wall_collision_node.addSolid(CollisionPolygon(Point3(14.7, -15, 5), Point3(14.7, -32, 19.2), Point3(22.9, -32, 19.2), Point3(22.9, -15, 5)))
-        self.wall_collision_node.addSolid(CollisionBox(Point3(-16, -35, 14), 31, 28, 4.95))
-        self.wall_collision_node.addSolid(CollisionBox(Point3(28, -47.5, 14), 13.5, 15.5, 4.95))
-        self.wall_collision_node.addSolid(CollisionBox(Point3(32, -18.51, 14), 10, 13.5, 5))
-        self.wall_collision_node.addSolid(CollisionPolygon(Point3(22, -29, 19.2), Point3(22, -33, 19.2), (50, -33, 19.2),Point3(50, -29, 19.2)))
-        self.wall_collision_node.addSolid(CollisionPolygon(Point3(13.7, -32, 19.2), Point3(13.7, -67, 19.2), Point3(22.9, -67, 19.2), Point3(22.9, -32, 19.2)))
-        self.wall_collision_node.addSolid(CollisionBox(Point3(-10.8, -35, 21), 15.2, 5.9, .75))
-        self.wall_collision_node.addSolid(CollisionBox(Point3(6, -35, 21), 2, 4.5, .75))
-        self.wall_collision_node.addSolid(CollisionBox(Point3(-28, -35, 21), 2, 4.5, .75))
-        self.wall_collision_node.addSolid(CollisionPolygon(Point3(14.7, -32, 19.2), Point3(14.7, -36, 26), Point3(19, -36, 26), Point3(19, -32, 19.2)))
-        self.wall_collision_node.addSolid(CollisionPolygon(Point3(10, -36, 34), Point3(10, -40, 34), Point3(17, -40, 26), Point3(14, -36, 26)))
-        self.wall_collision_node.addSolid(CollisionPolygon(Point3(10, -29, 40), Point3(10, -39, 34), Point3(13.5, -36, 29), Point3(13.5, -29, 42)))
-        self.wall_collision_node.addSolid(CollisionPolygon(Point3(12, -27, 39), Point3(12, -32, 37), Point3(19, -34, 46), Point3(19, -28, 46)))
-        self.wall_collision_node.addSolid(CollisionPolygon(Point3(14, -31, 42), Point3(17, -37, 49), Point3(19, -37, 49), Point3(19, -31, 46)))
-        self.wall_collision_node.addSolid(CollisionPolygon(Point3(19, -32, 19.2), Point3(19, -36, 26), Point3(20.5, -36, 26), Point3(20.5, -32, 19.2)))
-        self.wall_collision_node.addSolid(CollisionPolygon(Point3(14, -36, 26), Point3(17, -40, 28), Point3(20.5, -36, 26)))
-        self.wall_collision_node.addSolid(CollisionPolygon(Point3(9, -37, 33), Point3(13, -40, 31), Point3(14, -36, 26)))
-        self.wall_collision_node.addSolid(CollisionPolygon(Point3(12.2, -28, 39), Point3(13.5, -36, 29), Point3(16, -33, 41.5)))
-        self.wall_collision_node.addSolid(CollisionBox(Point3(19, -37.75, 20), 2, 3, 3))
-        self.wall_collision_node.addSolid(CollisionBox(Point3(16, -38.5, 20), 3, 3.5, 3))
-        self.wall_collision_node.addSolid(CollisionPolygon(Point3(20.5, -32, 19.2), Point3(20.5, -36, 26), Point3(20.5, -36, 29.2), Point3(20.5, -32, 26)))
-        self.wall_collision_node.addSolid(CollisionPolygon(Point3(10, -40, 34), Point3(10, -40, 39), Point3(17, -40, 29.2), Point3(17, -40, 26)))
-        self.wall_collision_node.addSolid(CollisionPolygon(Point3(17, -40, 26), Point3(17, -40, 29.2), Point3(20.5, -36, 29.2), Point3(20.5, -36, 26)))
-        self.wall_collision_node.addSolid(CollisionPolygon(Point3(8.75, -37, 32), Point3(8.75, -37, 39), Point3(10, -40, 39), Point3(10, -40, 34)))
-        self.wall_collision_node.addSolid(CollisionPolygon(Point3(10, -29, 40), Point3(10, -29, 46), Point3(8.75, -37, 39), Point3(8.75, -37, 32)))
-        self.wall_collision_node.addSolid(CollisionPolygon(Point3(12, -27, 40), Point3(12, -27, 46), Point3(10, -29, 46), Point3(10, -29, 40)))
-        self.wall_collision_node.addSolid(CollisionPolygon(Point3(19, -28, 46), Point3(19, -28, 52), Point3(12, -27, 46), Point3(12, -27, 40)))
-        self.wall_collision_node.addSolid(CollisionPolygon(Point3(19, -28, 46), Point3(19, -34, 46), Point3(19, -34, 52), Point3(19, -28, 52)))
-        self.wall_collision_node.addSolid(CollisionBox(Point3(14.6, -33.75, 17), .7, .7, 25))
-
-        self.wall_collision_node_path = self.render.attachNewNode(self.wall_collision_node)
-#        self.wall_collision_node_path.show()
+        # The walls are described in levels/mansion.json
+        self.level = load_level(self.loader, "mansion")
+        self.wall_collision_node_path = self.level.find("wall")
+        self.wall_collision_node_path.reparentTo(self.render)
+        self.wall_collision_node = self.wall_collision_node_path.node()
+        # Each door brings in door_ghosts ghosts the first time it is walked through
+        self.triggers = TriggerVolumes(self.cTrav, self.camera)
+        for trigger, x, y, ghosts, cooldown in spawn_triggers(self.level):
+            self.triggers.add(trigger, self.spawnnpcs, args=(self.door_ghosts, x, y), cooldown=None)
+        self.level.find("spawns").reparentTo(self.render)
     def set(self):
         self.Aiworld = AIWorld(self.render)
+        self.npcgrid = SpatialGrid(self.separation_threshold)
         self.i = 0
         #AI World update
         taskMgr.add(self.Update,"Update")
-        taskMgr.add(self.spawnatdoor1,"spawnatdoor1")
-        taskMgr.add(self.spawnatdoor2,"spawnatdoor2")
-        taskMgr.add(self.spawnatdoor3,"spawnatdoor3")
-        taskMgr.add(self.spawnatdoor4,"spawnatdoor4")
-        taskMgr.add(self.spawnatdoor5,"spawnatdoor5")
-        taskMgr.add(self.spawnatdoor6,"spawnatdoor6")
         taskMgr.add(self.manaupdate,"manaupdate")
     def Update(self,task):
         camera_forward = self.camera.getQuat(self.render).getForward()
@@ -468,20 +363,12 @@ class MyApp(ShowBase):
             if not npc.isEmpty() and not aidot.isEmpty():
                 update_npc_position(npc, aidot)
         # Separation logic to prevent NPC overlap
-            separation_threshold = 3  # Minimum distance between NPCs
-            repelling_force = 1  # Strength of the repelling force
-            npc_positions = {name: npc.getPos(self.render) for name, npc in self.npcs.items() if not npc.isEmpty()}
-            for name_a, pos_a in npc_positions.items():
-                for name_b, pos_b in npc_positions.items():
-                    if name_a != name_b:
-                        distance = (pos_a - pos_b).length()
-                        if distance < separation_threshold:
-                        # Calculate repelling direction
-                            direction = pos_a - pos_b
-                            direction.normalize()
-                        # Apply the repelling force
-                            new_pos = pos_a + direction * repelling_force
-                            self.npcs[name_a].setPos(new_pos)
+        live_npcs = [npc for npc in self.npcs.values() if not npc.isEmpty()]
+        npc_positions = [npc.getPos(self.render) for npc in live_npcs]
+        offsets = separation_offsets(npc_positions, self.separation_threshold, self.repelling_force, self.npcgrid)
+        for npc, pos, offset in zip(live_npcs, npc_positions, offsets):
+            if offset is not None:
+                npc.setPos(pos + LVector3(*offset))
         self.bar['value'] = self.healthpoints
         self.Aiworld.update()
         if self.healthpoints == 0:
@@ -0,0 +1,25 @@
+class FixedStep:
+    # Turns the variable frame time into a whole number of fixed simulation
+    # ticks.  Time that doesn't make up a full tick is carried over to the
+    # next frame; alpha is how far the frame is into the next tick, so that
+    # rendering can interpolate between the last two ticks.
+    #
+    # A very long frame (loading, a breakpoint, a background browser tab) is
+    # cut to max_frame_time, so that the game slows down rather than trying
+    # to catch up with hundreds of ticks at once.
+    def __init__(self, rate=60, max_frame_time=.25):
+        self.rate = rate
+        self.step = 1.0 / rate
+        self.max_frame_time = max_frame_time
+        self.accumulator = 0.0
+        self.alpha = 0.0
+        self.ticks = 0
+
+    def advance(self, dt):
+        # Returns the number of ticks to run for a frame of dt seconds.
+        self.accumulator += min(dt, self.max_frame_time)
+        count = int(self.accumulator / self.step)
+        self.accumulator -= count * self.step
+        self.alpha = self.accumulator / self.step
+        self.ticks += count
+        return count
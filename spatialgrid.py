@@ -0,0 +1,81 @@
+from math import floor, sqrt
+
+
+class SpatialGrid:
+    # Uniform grid over the XY plane, used to find nearby ghosts without
+    # comparing every pair.  The cell size must be at least the search radius,
+    # so that only the 3x3 block of cells around a point needs to be checked.
+    def __init__(self, cell_size):
+        self.cell_size = cell_size
+        self._cells = {}
+
+    def _cell(self, x, y):
+        return (floor(x / self.cell_size), floor(y / self.cell_size))
+
+    def clear(self):
+        self._cells.clear()
+
+    def insert(self, index, x, y):
+        key = self._cell(x, y)
+        cell = self._cells.get(key)
+        if cell is None:
+            self._cells[key] = [index]
+        else:
+            cell.append(index)
+
+    def rebuild(self, positions):
+        self._cells.clear()
+        for index, pos in enumerate(positions):
+            self.insert(index, pos[0], pos[1])
+
+    def candidates(self, x, y):
+        # Everything in the surrounding cells, which may include points
+        # farther away than cell_size; callers still need to test distance.
+        cx, cy = self._cell(x, y)
+        cells = self._cells
+        for gx in (cx - 1, cx, cx + 1):
+            for gy in (cy - 1, cy, cy + 1):
+                cell = cells.get((gx, gy))
+                if cell is not None:
+                    yield from cell
+
+
+def separation_offsets(positions, separation_threshold, repelling_force, grid=None):
+    # Returns, for each position, the (x, y, z) offset pushing it away from a
+    # neighbour closer than separation_threshold, or None if there is none.
+    # Like the old all-pairs loop, only one neighbour counts: the last one in
+    # the order the positions were given in.
+    if grid is None or grid.cell_size < separation_threshold:
+        grid = SpatialGrid(separation_threshold)
+    grid.rebuild(positions)
+
+    offsets = []
+    for index, pos_a in enumerate(positions):
+        ax, ay, az = pos_a[0], pos_a[1], pos_a[2]
+        nearest = -1
+        push = None
+        for other in grid.candidates(ax, ay):
+            if other == index or other < nearest:
+                continue
+            pos_b = positions[other]
+            dx = ax - pos_b[0]
+            dy = ay - pos_b[1]
+            dz = az - pos_b[2]
+            distance = sqrt(dx * dx + dy * dy + dz * dz)
+            if distance < separation_threshold:
+                nearest = other
+                push = (dx, dy, dz, distance)
+
+        if push is None:
+            offsets.append(None)
+            continue
+
+        dx, dy, dz, distance = push
+        if distance > 0:
+            scale = repelling_force / distance
+            offsets.append((dx * scale, dy * scale, dz * scale))
+        else:
+            # Two ghosts exactly on top of each other have no direction to
+            # be pushed in, same as normalizing a zero vector.
+            offsets.append((0.0, 0.0, 0.0))
+    return offsets
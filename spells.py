@@ -0,0 +1,62 @@
+from math import cos, sin, radians, tau
+from panda3d.core import BitMask32
+from picking import Picker
+from npcqueries import ids_within, ids_in_cone
+
+# Spells the wand can cast besides its single ray (MyApp.click).  Each one
+# finds all of its targets with one query and returns their ids, once per
+# ghost per hit; MyApp.cast applies damage to each and takes cost mana once.
+
+
+def spread_directions(rays, spread):
+    # One ray straight ahead (+y) and the others evenly around it, spread
+    # degrees off
+    directions = [(0, 1, 0)]
+    for i in range(rays - 1):
+        turn = tau * i / (rays - 1)
+        directions.append((sin(radians(spread)) * cos(turn), cos(radians(spread)), sin(radians(spread)) * sin(turn)))
+    return directions
+
+
+class Shotgun:
+    # A spread of rays from the camera, all traversed together; walls block
+    # each ray on its own.  A ghost hit by several rays is damaged for each.
+    def __init__(self, camera, rays=8, spread=6, damage=1, cost=6, mask=BitMask32.bit(0)):
+        self.damage = damage
+        self.cost = cost
+        self.picker = Picker(camera, mask, 'shotgun', spread_directions(rays, spread))
+
+    def targets(self, app):
+        ids = []
+        for entry in self.picker.pick_each(app.pickables, app.wall_collision_node_path):
+            npc_id = app.npcs.find(entry.getIntoNode())
+            if npc_id is not None:
+                ids.append(npc_id)
+        return ids
+
+
+class Cone:
+    # Every ghost up to distance away and within angle degrees of where the
+    # camera looks.  It goes through walls.
+    def __init__(self, angle=20, distance=20, damage=2, cost=8):
+        self.angle = angle
+        self.distance = distance
+        self.damage = damage
+        self.cost = cost
+
+    def targets(self, app):
+        pos = app.camera.getPos(app.render)
+        forward = app.camera.getQuat(app.render).getForward()
+        return ids_in_cone(app.npcs, pos[0], pos[1], pos[2], tuple(forward), self.angle, self.distance)
+
+
+class Nova:
+    # Every ghost within radius of the camera, through walls
+    def __init__(self, radius=8, damage=1, cost=10):
+        self.radius = radius
+        self.damage = damage
+        self.cost = cost
+
+    def targets(self, app):
+        pos = app.camera.getPos(app.render)
+        return ids_within(app.npcs, pos[0], pos[1], pos[2], self.radius)
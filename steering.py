@@ -0,0 +1,232 @@
+import numpy as np
+
+
+class SteeringWorld:
+    # Steers every ghost toward a target with the pursue and arrival
+    # behaviours of panda3d.ai, but for all ghosts at once in NumPy instead of
+    # one AICharacter at a time, followed by the separation pass from
+    # MyApp.Update.  It can be used in place of AIWorld: call update() once
+    # per frame.
+    #
+    # Like panda3d.ai, movement is per update rather than per second: the
+    # pursue force grows every update, is added to the steering force (capped
+    # at max_force) and the ghost moves by steering force / mass.  Within
+    # arrival_distance of the target, the steering force is reduced instead
+    # until the ghost is within one unit of the target.
+    #
+    # The steered position is kept here; the positions written into the NPC
+    # registry additionally have separation applied, as the ghost nodes did
+    # when they followed the aidot proxies.
+    #
+    # If flowfield is set to a flowfield.FlowField, pursuing ghosts follow it
+    # around the walls instead of heading straight for the target.
+    def __init__(self, registry, target, render, height=8, mass=100, movt_force=0.05, max_force=5,
+                 arrival_distance=7, separation_threshold=3, repelling_force=.3):
+        self.registry = registry
+        self.target = target
+        self.render = render
+        self.height = height
+        self.mass = mass
+        self.movt_force = movt_force
+        self.max_force = max_force
+        self.arrival_distance = arrival_distance
+        self.separation_threshold = separation_threshold
+        self.repelling_force = repelling_force
+
+        self.capacity = 0
+        self._pos = np.zeros((0, 3))
+        self._force = np.zeros((0, 3))
+        self._pursue = np.zeros(0)
+        self._heading = np.zeros(0)
+        self._arriving = np.zeros(0, dtype=bool)
+        self._started = np.zeros(0, dtype=bool)  # has had its first update
+        self._active = np.zeros(0, dtype=bool)
+        self.flowfield = None
+
+    def _grow(self, capacity):
+        extra = capacity - self.capacity
+        self._pos = np.concatenate((self._pos, np.zeros((extra, 3))))
+        self._force = np.concatenate((self._force, np.zeros((extra, 3))))
+        self._pursue = np.concatenate((self._pursue, np.zeros(extra)))
+        self._heading = np.concatenate((self._heading, np.zeros(extra)))
+        self._arriving = np.concatenate((self._arriving, np.zeros(extra, dtype=bool)))
+        self._started = np.concatenate((self._started, np.zeros(extra, dtype=bool)))
+        self._active = np.concatenate((self._active, np.zeros(extra, dtype=bool)))
+        self.capacity = capacity
+
+    def start(self, npc_id):
+        # Begins steering a ghost from the position it has in the registry.
+        if npc_id >= self.capacity:
+            self._grow(self.registry.capacity)
+        self._pos[npc_id] = self.registry.get_pos(npc_id)
+        self._force[npc_id] = 0
+        self._pursue[npc_id] = 0
+        self._heading[npc_id] = self.registry.headings[npc_id]
+        self._arriving[npc_id] = False
+        self._started[npc_id] = False
+        self._active[npc_id] = True
+
+    def stop(self, npc_id):
+        self._active[npc_id] = False
+
+    def update(self, ids=None, steps=None):
+        # Steps the given ghosts (by default all of them).  steps can give,
+        # per ghost, a number of updates to make up for in one go; that is
+        # only an approximation, meant for ghosts far from the player.
+        if ids is None:
+            ids = np.flatnonzero(self._active)
+            steps = np.ones(len(ids))
+        else:
+            ids = np.asarray(ids, dtype=np.intp)
+            steps = np.ones(len(ids)) if steps is None else np.asarray(steps, dtype=np.float64)
+            active = self._active[ids]
+            ids = ids[active]
+            steps = steps[active]
+
+        if not len(ids):
+            return
+        self._step(ids, steps)
+
+        # Only the ghosts stepped now are separated, the others keep the push
+        # they were last given; but their neighbours can be any ghost.
+        active = np.flatnonzero(self._active)
+        pos = self._pos[active]
+        pos[:, 2] = self.height
+        rows = np.searchsorted(active, ids)
+        self._write(ids, pos[rows] + self.separation(pos, rows), self._heading[ids])
+
+    def _step(self, ids, steps):
+        pos = self._pos[ids]
+        pos[:, 2] = self.height
+        force = self._force[ids]
+        pursue = self._pursue[ids]
+        arriving = self._arriving[ids]
+
+        target = self.target.getPos(self.render)
+        delta = np.asarray(target, dtype=np.float64) - pos
+        distance = np.sqrt(np.einsum('ij,ij->i', delta, delta))
+
+        # Ghosts that fell behind stop arriving and start pursuing again from
+        # scratch; they keep their current steering force for this update.
+        leaving = arriving & (distance > self.arrival_distance)
+        # panda3d.ai only switches arrival on after the first update, so a
+        # ghost spawned within arrival_distance still pursues once and then
+        # drifts on, braking.
+        started = self._started[ids]
+        arriving = (arriving & ~leaving) | (~arriving & started & (distance < self.arrival_distance))
+        pursuing = ~arriving & ~leaving
+        pursue[leaving] = 0
+
+        pursue[pursuing] += self.movt_force * steps[pursuing]
+        with np.errstate(invalid='ignore', divide='ignore'):
+            direction = delta / distance[:, None]
+        if self.flowfield is not None:
+            self.flowfield.update(target[0], target[1])
+            self._follow_flow(pos, direction)
+        force[pursuing] += direction[pursuing] * (pursue * steps)[pursuing, None]
+        length = np.sqrt(np.einsum('ij,ij->i', force, force))
+        capped = pursuing & (length > self.max_force)
+        force[capped] *= (self.max_force / length[capped])[:, None]
+
+        # Within a unit of the target the force is dropped, pursuing or not
+        arrived = distance < 1
+        force[arrived] = 0
+        braking = arriving & ~arrived & (length > 0)
+        speed = length[braking] / self.mass
+        # panda3d.ai builds its arrival force as a vector with the same value
+        # in all three components, hence the sqrt(3).
+        brake = np.sqrt(3) * speed * speed / (2 * distance[braking]) * self.mass * steps[braking]
+        remaining = np.maximum(length[braking] - brake, 0)
+        force[braking] *= (remaining / length[braking])[:, None]
+
+        pos += force / self.mass * steps[:, None]
+        length = np.sqrt(np.einsum('ij,ij->i', force, force))
+        moving = length > 0
+        heading = self._heading[ids]
+        heading[moving] = np.degrees(np.arctan2(force[moving, 0], -force[moving, 1]))
+
+        self._pos[ids] = pos
+        self._force[ids] = force
+        self._pursue[ids] = pursue
+        self._heading[ids] = heading
+        self._arriving[ids] = arriving
+        self._started[ids] = True
+
+    def _follow_flow(self, pos, direction):
+        # Replaces the direction with the flow field's wherever it has one.
+        field = self.flowfield
+        i = np.floor((pos[:, 0] - field.x0) / field.cell_size).astype(np.intp)
+        j = np.floor((pos[:, 1] - field.y0) / field.cell_size).astype(np.intp)
+        inside = (i >= 0) & (i < field.width) & (j >= 0) & (j < field.depth)
+        rows = np.flatnonzero(inside)
+        cells = j[rows] * field.width + i[rows]
+        distance = np.frombuffer(field.distance, dtype=np.int32)
+        flow = np.frombuffer(field.flow, dtype=np.float32).reshape(-1, 2)
+        guided = distance[cells] > 0
+        rows = rows[guided]
+        direction[rows, :2] = flow[cells[guided]]
+        direction[rows, 2] = 0
+        del distance, flow
+
+    def separation(self, pos, rows=None):
+        # Same rule as spatialgrid.separation_offsets: each of pos[rows] (by
+        # default all of pos) is pushed away from the last ghost in pos that
+        # is too close to it.  Like spatialgrid.SpatialGrid, the ghosts are
+        # bucketed in cells as big as the separation threshold, here by
+        # sorting them on their cell, so only the 3x3 cells around each ghost
+        # are compared.
+        if rows is None:
+            rows = np.arange(len(pos))
+        offsets = np.zeros((len(rows), 3))
+        if not len(rows):
+            return offsets
+        threshold = self.separation_threshold
+        cx = np.floor(pos[:, 0] / threshold).astype(np.int64)
+        cy = np.floor(pos[:, 1] / threshold).astype(np.int64)
+        # Shifted so that the cells around every ghost have keys >= 0
+        cx -= cx.min() - 1
+        cy -= cy.min() - 1
+        stride = cy.max() + 2
+        keys = cx * stride + cy
+        order = np.argsort(keys, kind="stable")
+        sorted_keys = keys[order]
+
+        queries = []
+        candidates = []
+        for dx in (-stride, 0, stride):
+            for dy in (-1, 0, 1):
+                cell = keys[rows] + dx + dy
+                start = np.searchsorted(sorted_keys, cell, "left")
+                counts = np.searchsorted(sorted_keys, cell, "right") - start
+                total = counts.sum()
+                if not total:
+                    continue
+                firsts = np.cumsum(counts) - counts
+                within = np.arange(total) - np.repeat(firsts, counts)
+                queries.append(np.repeat(np.arange(len(rows)), counts))
+                candidates.append(order[np.repeat(start, counts) + within])
+        query = np.concatenate(queries)
+        other = np.concatenate(candidates)
+
+        delta = pos[rows[query]] - pos[other]
+        distance = np.sqrt(np.einsum('ij,ij->i', delta, delta))
+        close = (distance < threshold) & (other != rows[query])
+        last = np.full(len(rows), -1)
+        np.maximum.at(last, query[close], other[close])
+
+        pushed = np.flatnonzero(last >= 0)
+        push = pos[rows[pushed]] - pos[last[pushed]]
+        apart = np.sqrt(np.einsum('ij,ij->i', push, push))
+        nonzero = apart > 0
+        offsets[pushed[nonzero]] = push[nonzero] * (self.repelling_force / apart[nonzero])[:, None]
+        return offsets
+
+    def _write(self, ids, pos, heading):
+        # Bulk copy into the registry's float32 buffers.  The views must not
+        # outlive this call, or the registry could not grow its arrays.
+        registry = self.registry
+        positions = np.frombuffer(registry.positions, dtype=np.float32).reshape(-1, 3)
+        positions[ids] = pos
+        headings = np.frombuffer(registry.headings, dtype=np.float32)
+        headings[ids] = heading
+        del positions, headings
@@ -0,0 +1,56 @@
+import random
+import unittest
+from math import sqrt
+from spatialgrid import SpatialGrid, separation_offsets
+
+
+def pairwise_offsets(positions, separation_threshold, repelling_force):
+    # The rule separation_offsets replaces: every ghost compared with every
+    # other, each push overwriting the last, so the last neighbour in range wins
+    offsets = [None] * len(positions)
+    for a, pos_a in enumerate(positions):
+        for b, pos_b in enumerate(positions):
+            if a != b:
+                dx, dy, dz = (pos_a[i] - pos_b[i] for i in range(3))
+                distance = sqrt(dx * dx + dy * dy + dz * dz)
+                if distance < separation_threshold:
+                    if distance > 0:
+                        scale = repelling_force / distance
+                        offsets[a] = (dx * scale, dy * scale, dz * scale)
+                    else:
+                        offsets[a] = (0.0, 0.0, 0.0)
+    return offsets
+
+
+class SeparationTest(unittest.TestCase):
+    def assertSameOffsets(self, offsets, expected):
+        self.assertEqual(len(offsets), len(expected))
+        for offset, wanted in zip(offsets, expected):
+            if wanted is None:
+                self.assertIsNone(offset)
+            else:
+                for got, want in zip(offset, wanted):
+                    self.assertAlmostEqual(got, want)
+
+    def test_matches_pairwise_rule(self):
+        rng = random.Random(1)
+        grid = SpatialGrid(3)
+        for layout in range(300):
+            count = rng.randrange(0, 40)
+            spread = rng.choice((2, 10, 40))
+            positions = [(rng.uniform(-spread, spread), rng.uniform(-spread, spread), rng.uniform(0, 4))
+                         for i in range(count)]
+            self.assertSameOffsets(separation_offsets(positions, 3, .3, grid), pairwise_offsets(positions, 3, .3))
+
+    def test_small_grid_is_replaced(self):
+        # Cells smaller than the threshold would miss neighbours
+        positions = [(0, 0, 0), (2.5, 0, 0), (10, 10, 0)]
+        self.assertSameOffsets(separation_offsets(positions, 3, .3, SpatialGrid(1)), pairwise_offsets(positions, 3, .3))
+
+    def test_coincident_ghosts(self):
+        positions = [(1, 1, 1), (1, 1, 1)]
+        self.assertEqual(separation_offsets(positions, 3, .3), [(0.0, 0.0, 0.0), (0.0, 0.0, 0.0)])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,67 @@
+import unittest
+from panda3d.core import NodePath, CollisionNode
+from panda3d.ai import AIWorld, AICharacter
+from npcregistry import NPCRegistry
+
+try:
+    from steering import SteeringWorld
+except ImportError:
+    SteeringWorld = None
+
+
+def paths(spawn, target=(0, 0, 8), ticks=300):
+    # The (x, y) of one ghost per tick, steered toward target by panda3d.ai
+    # and by SteeringWorld, set up as MyApp does
+    render = NodePath("render")
+    camera = render.attachNewNode("camera")
+    camera.setPos(*target)
+
+    world = AIWorld(render)
+    aidot = render.attachNewNode("aidot")
+    aidot.setPos(*spawn)
+    aichar = AICharacter("ghost", aidot, 100, 0.05, 5)
+    world.addAiChar(aichar)
+    behaviors = aichar.getAiBehaviors()
+    behaviors.pursue(camera)
+    behaviors.arrival(7)
+
+    registry = NPCRegistry()
+    node = render.attachNewNode("ghost")
+    node.setPos(*spawn)
+    npc_id = registry.add(node, None, None, None, node.attachNewNode(CollisionNode("ghost")), 3)
+    steering = SteeringWorld(registry, camera, render, height=8)
+    steering.start(npc_id)
+
+    panda = []
+    numpy = []
+    for tick in range(ticks):
+        aidot.setZ(8)
+        world.update()
+        steering.update()
+        panda.append((aidot.getX(), aidot.getY()))
+        numpy.append(tuple(steering._pos[npc_id, :2]))
+    world.removeAiChar("ghost")
+    return panda, numpy
+
+
+@unittest.skipIf(SteeringWorld is None, "needs numpy")
+class BackendTest(unittest.TestCase):
+    def assertSamePaths(self, spawn):
+        panda, numpy = paths(spawn)
+        for tick, (a, b) in enumerate(zip(panda, numpy)):
+            self.assertAlmostEqual(a[0], b[0], places=3, msg="x at tick %d" % tick)
+            self.assertAlmostEqual(a[1], b[1], places=3, msg="y at tick %d" % tick)
+
+    def test_spawn_within_arrival_distance(self):
+        # Door spawns happen where the player is
+        self.assertSamePaths((3, 2, 10))
+
+    def test_spawn_next_to_target(self):
+        self.assertSamePaths((.7, .1, 10))
+
+    def test_spawn_far_away(self):
+        self.assertSamePaths((12, 0, 10))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,59 @@
+from direct.showbase.DirectObject import DirectObject
+from panda3d.core import CollisionHandlerEvent, CollisionNode, CollisionSphere, BitMask32, ClockObject
+import layers
+
+
+class TriggerVolumes(DirectObject):
+    # Collision boxes that call a function when the player walks into or out
+    # of them.  A small probe sphere on the player is a collider of the main
+    # traverser with an event handler, so nothing is polled: the traversal
+    # that moves the player throws '<trigger name>-enter' and
+    # '<trigger name>-exit' events, once per crossing, however fast it went.
+    #
+    # After it has gone off, a trigger ignores entries for its cooldown in
+    # seconds of game time; None makes it go off only once.
+    def __init__(self, traverser, player, mask=layers.TRIGGER, radius=.5, clock=None):
+        self.mask = mask
+        self.clock = ClockObject.getGlobalClock() if clock is None else clock
+        self.handler = CollisionHandlerEvent()
+        self.handler.addInPattern('%in-enter')
+        self.handler.addOutPattern('%in-exit')
+        probe = CollisionNode('trigger-probe')
+        probe.addSolid(CollisionSphere(0, 0, 0, radius))
+        probe.setFromCollideMask(mask)
+        probe.setIntoCollideMask(BitMask32.allOff())
+        self.probe = player.attachNewNode(probe)
+        self.traverser = traverser
+        self.traverser.addCollider(self.probe, self.handler)
+        self.triggers = {}  # name: [on_enter, on_exit, args, cooldown, time it went off]
+
+    def add(self, path, on_enter=None, on_exit=None, args=(), cooldown=0):
+        # path is a CollisionNode with a name of its own; it is put in the
+        # trigger layer
+        name = path.getName()
+        path.node().setIntoCollideMask(self.mask)
+        self.triggers[name] = [on_enter, on_exit, args, cooldown, None]
+        self.accept(name + '-enter', self.enter, [name])
+        self.accept(name + '-exit', self.exit, [name])
+
+    def enter(self, name, entry):
+        trigger = self.triggers[name]
+        on_enter, on_exit, args, cooldown, went_off = trigger
+        now = self.clock.getFrameTime()
+        if went_off is not None and (cooldown is None or now - went_off < cooldown):
+            return
+        trigger[4] = now
+        if on_enter is not None:
+            on_enter(*args)
+
+    def exit(self, name, entry):
+        on_exit, args = self.triggers[name][1:3]
+        if on_exit is not None:
+            on_exit(*args)
+
+    def destroy(self):
+        # Stops all triggers
+        self.ignoreAll()
+        self.traverser.removeCollider(self.probe)
+        self.probe.removeNode()
+        self.triggers = {}